@@ -0,0 +1,373 @@
+"""Benchmark the NER pipelines on synthetic corpora.
+
+e.g. python -m benchmarks.run --terms 100000 --docs 10000 --density 0.05
+"""
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+from datetime import datetime
+from time import process_time
+from timeit import default_timer as timer
+from typing import Callable, Dict, Optional, Tuple
+
+import click
+import pandas as pd
+
+from benchmarks import synthetic
+from ontorunner import __version__
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULTS_FILE = os.path.join(HERE, "results.jsonl")
+SETTINGS_TEMPLATE = """[Section]
+[Shared]
+[Main]
+include_header = True
+input-directory = {data_dir}/input
+output-directory = {workdir}/oger_output
+pointer-type = glob
+pointers = *.tsv
+iter-mode = collection
+article-format = txt_tsv
+export_format = tsv
+termlist1_path = {data_dir}/terms/synth_termlist.tsv
+termlist_stopwords = {data_dir}/stopwords/stopWords.txt
+termlist_normalize = lowercase stem-Porter
+"""
+
+
+class Workspace(object):
+    """Synthetic data directory shared by the benchmarks."""
+
+    def __init__(
+        self,
+        workdir: str,
+        n_terms: int,
+        n_docs: int,
+        match_density: float,
+        words_per_doc: int,
+        workers: int,
+        seed: int,
+    ):
+        self.workdir = workdir
+        self.workers = workers
+        self.data_dir = os.path.join(workdir, "data")
+        self.nodes_and_edges_dir = os.path.join(self.data_dir, "nodes_and_edges")
+        self.nodes_file = os.path.join(self.nodes_and_edges_dir, "synth_nodes.tsv")
+        self.edges_file = os.path.join(self.nodes_and_edges_dir, "synth_edges.tsv")
+        self.termlist_file = os.path.join(self.data_dir, "terms", "synth_termlist.tsv")
+        self.input_dir = os.path.join(self.data_dir, "input")
+        self.sentence_dir = os.path.join(workdir, "sentence_output")
+        self.settings_file = os.path.join(workdir, "settings.ini")
+        for directory in [
+            self.nodes_and_edges_dir,
+            self.input_dir,
+            self.sentence_dir,
+            os.path.join(self.data_dir, "terms"),
+            os.path.join(self.data_dir, "stopwords"),
+            os.path.join(self.data_dir, "output"),
+            os.path.join(self.data_dir, "serialized"),
+            os.path.join(workdir, "oger_output"),
+        ]:
+            os.makedirs(directory, exist_ok=True)
+
+        self.terms = synthetic.write_nodes(self.nodes_file, n_terms, seed=seed)
+        synthetic.write_edges(self.edges_file, n_terms, seed=seed)
+        self.mentions = synthetic.write_documents(
+            os.path.join(self.input_dir, "documents.tsv"),
+            n_docs,
+            self.terms,
+            match_density,
+            words_per_doc,
+            seed,
+        )
+        synthetic.write_oger_output(
+            os.path.join(self.sentence_dir, "documents.tsv"), self.mentions, self.terms
+        )
+        with open(os.path.join(self.data_dir, "stopwords", "stopWords.txt"), "w") as f:
+            f.write("the\n")
+        with open(self.settings_file, "w") as f:
+            f.write(SETTINGS_TEMPLATE.format(data_dir=self.data_dir, workdir=workdir))
+        self.n_docs = n_docs
+
+    def get_ner_df(self) -> pd.DataFrame:
+        """Get the mentions in the shape of spaCy NER output.
+
+        :return: Pandas DataFrame.
+        """
+        return pd.DataFrame(
+            {
+                "document_id": [m[0] for m in self.mentions],
+                "matched_term": [self.terms[m[1]] for m in self.mentions],
+                "object_id": [f"SYNTH:{m[1]}" for m in self.mentions],
+                "object_category": synthetic.CATEGORY,
+                "object_label": [self.terms[m[1]] for m in self.mentions],
+                "origin": synthetic.ORIGIN,
+                "start": [m[2] for m in self.mentions],
+                "end": [m[3] for m in self.mentions],
+            }
+        )
+
+    def clear_term_index(self) -> None:
+        """Remove the compiled term index."""
+        shutil.rmtree(
+            os.path.join(self.data_dir, "serialized", "term_index"), ignore_errors=True
+        )
+
+
+# A benchmark prepares its input and returns the function to time,
+# with the number of items (terms, rows or documents) it processes.
+Benchmark = Callable[[Workspace], Tuple[Callable[[], object], int]]
+
+
+def bench_biohub_converter(ws: Workspace):
+    from ontorunner.converters import biohub_converter
+
+    return (
+        lambda: biohub_converter.parse(ws.nodes_file, ws.termlist_file, ws.workers),
+        len(ws.terms),
+    )
+
+
+def bench_consolidate_rows(ws: Workspace):
+    from ontorunner.post.util import consolidate_rows
+
+    ner_df = ws.get_ner_df()
+    return lambda: consolidate_rows(ner_df.copy()), len(ner_df)
+
+
+def bench_get_column_doc_ratio(ws: Workspace):
+    from ontorunner.post.util import get_column_doc_ratio
+
+    ner_df = ws.get_ner_df()
+    return lambda: get_column_doc_ratio(ner_df.copy(), "matched_term"), len(ner_df)
+
+
+def bench_get_doc_ratios(ws: Workspace):
+    from ontorunner.post.util import get_doc_ratios
+
+    ner_df = ws.get_ner_df()
+    return (
+        lambda: get_doc_ratios(ner_df.copy(), ["object_label", "matched_term"]),
+        len(ner_df),
+    )
+
+
+def bench_get_ancestors(ws: Workspace):
+    from ontorunner.post.util import get_ancestors
+
+    ner_df = ws.get_ner_df()
+    return (
+        lambda: get_ancestors(ner_df, ws.nodes_and_edges_dir, serial_dir=None),
+        len(ner_df),
+    )
+
+
+def bench_add_sentence(ws: Workspace):
+    from ontorunner.post import add_sentence
+
+    return (
+        lambda: add_sentence.parse(
+            ws.input_dir, ws.sentence_dir, ws.nodes_and_edges_dir, False, ws.workers
+        ),
+        len(ws.mentions),
+    )
+
+
+def bench_onto_ruler_cold(ws: Workspace):
+    from ontorunner.pipes.OntoRuler import OntoRuler
+
+    _ensure_termlist(ws)
+    ws.clear_term_index()
+    return (
+        lambda: OntoRuler(data_dir=ws.data_dir, settings_filepath=ws.settings_file),
+        len(ws.terms),
+    )
+
+
+def bench_onto_ruler_cached(ws: Workspace):
+    from ontorunner.pipes.OntoRuler import OntoRuler
+
+    _ensure_termlist(ws)
+    # Compiles the term index if the cold benchmark did not run.
+    OntoRuler(data_dir=ws.data_dir, settings_filepath=ws.settings_file)
+    return (
+        lambda: OntoRuler(data_dir=ws.data_dir, settings_filepath=ws.settings_file),
+        len(ws.terms),
+    )
+
+
+def bench_run_spacy(ws: Workspace):
+    from ontorunner.spacy_module import run_spacy
+
+    _ensure_termlist(ws)
+    return (
+        lambda: run_spacy(
+            data_dir=ws.data_dir,
+            settings_file=ws.settings_file,
+            chunk_size=1000 if ws.workers > 1 else None,
+            workers=ws.workers,
+        ),
+        ws.n_docs,
+    )
+
+
+def bench_run_oger(ws: Workspace):
+    from ontorunner.oger_module import run_oger
+
+    _ensure_termlist(ws)
+    return (
+        lambda: run_oger(
+            settings=ws.settings_file,
+            workers=ws.workers,
+            nodes_and_edges=ws.nodes_and_edges_dir,
+        ),
+        ws.n_docs,
+    )
+
+
+def _ensure_termlist(ws: Workspace) -> None:
+    if not os.path.isfile(ws.termlist_file):
+        from ontorunner.converters import biohub_converter
+
+        biohub_converter.parse(ws.nodes_file, ws.termlist_file, ws.workers)
+
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    "biohub_converter.parse": bench_biohub_converter,
+    "consolidate_rows": bench_consolidate_rows,
+    "get_column_doc_ratio": bench_get_column_doc_ratio,
+    "get_doc_ratios": bench_get_doc_ratios,
+    "get_ancestors": bench_get_ancestors,
+    "add_sentence.parse": bench_add_sentence,
+    "OntoRuler.cold": bench_onto_ruler_cold,
+    "OntoRuler.cached": bench_onto_ruler_cached,
+    "run_spacy": bench_run_spacy,
+    "run_oger": bench_run_oger,
+}
+
+
+def run_benchmark(name: str, ws: Workspace) -> dict:
+    """Run a benchmark once.
+
+    Benchmarks whose dependencies (packages, models or NLTK data) are
+    missing are reported as skipped rather than failing the suite.
+
+    :param name: Key of BENCHMARKS.
+    :param ws: Workspace object.
+    :return: Result record.
+    """
+    try:
+        func, items = BENCHMARKS[name](ws)
+        start_wall, start_cpu = timer(), process_time()
+        func()
+        wall_time, cpu_time = timer() - start_wall, process_time() - start_cpu
+    except (ImportError, OSError, LookupError) as e:
+        return {"status": "skipped", "error": repr(e)}
+    except Exception as e:
+        return {"status": "error", "error": repr(e)}
+    return {
+        "status": "ok",
+        "wall_time": wall_time,
+        "cpu_time": cpu_time,
+        "items": items,
+        "items_per_second": items / wall_time if wall_time else None,
+    }
+
+
+def _get_git_commit() -> Optional[str]:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=HERE,
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option("--terms", "-t", "n_terms", default=10_000, help="Number of terms.")
+@click.option("--docs", "-d", "n_docs", default=1_000, help="Number of documents.")
+@click.option(
+    "--density", "-m", default=0.05, help="Fraction of document words that are terms."
+)
+@click.option("--words-per-doc", default=200, help="Number of words per document.")
+@click.option(
+    "--benchmark",
+    "-b",
+    "names",
+    multiple=True,
+    type=click.Choice(list(BENCHMARKS)),
+    help="Benchmarks to run (all by default).",
+)
+@click.option("--repeat", "-n", default=1, help="Number of runs per benchmark.")
+@click.option("--workers", "-w", default=1, help="Number of worker processes.")
+@click.option("--seed", default=0)
+@click.option(
+    "--workdir", type=click.Path(), default=None, help="Keep the synthetic data here."
+)
+@click.option("--output", "-o", type=click.Path(), default=DEFAULT_RESULTS_FILE)
+def main(
+    n_terms,
+    n_docs,
+    density,
+    words_per_doc,
+    names,
+    repeat,
+    workers,
+    seed,
+    workdir,
+    output,
+):
+    """Run benchmarks and append their results to a JSON lines file."""
+    params = {
+        "terms": n_terms,
+        "docs": n_docs,
+        "density": density,
+        "words_per_doc": words_per_doc,
+        "workers": workers,
+        "seed": seed,
+    }
+    run_info = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "version": __version__,
+        "commit": _get_git_commit(),
+        "python": platform.python_version(),
+        "params": params,
+    }
+    tmpdir = None
+    if workdir is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        workdir = tmpdir.name
+    try:
+        start = timer()
+        ws = Workspace(workdir, n_terms, n_docs, density, words_per_doc, workers, seed)
+        print(f"Synthetic data generated in {timer() - start:.1f} seconds.")
+        with open(output, "a") as f:
+            for name in names or BENCHMARKS:
+                for i in range(repeat):
+                    record = {"benchmark": name, "run": i, **run_info}
+                    record.update(run_benchmark(name, ws))
+                    f.write(json.dumps(record) + "\n")
+                    f.flush()
+                    if record["status"] == "ok":
+                        print(
+                            f"{name}: {record['wall_time']:.2f} s, "
+                            f"{record['items_per_second']:.0f} items/s"
+                        )
+                    else:
+                        print(f"{name}: {record['status']} ({record['error']})")
+    finally:
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Synthetic ontologies and corpora for benchmarks."""
+import random
+from typing import List, Tuple
+
+ORIGIN = "synth.json"
+CATEGORY = "biolink:NamedThing"
+SYLLABLES = [c + v for c in "bcdfghklmnprstvz" for v in "aeiou"]
+
+
+def make_word(rng: random.Random) -> str:
+    """Make a pronounceable pseudo-word.
+
+    :param rng: Random number generator.
+    :return: Word of 2 to 4 syllables.
+    """
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def write_nodes(
+    path: str, n_terms: int, synonym_rate: float = 0.3, seed: int = 0
+) -> List[str]:
+    """Write a KGX nodes TSV of unique synthetic terms.
+
+    :param path: Output file path.
+    :param n_terms: Number of terms.
+    :param synonym_rate: Fraction of terms with a synonym.
+    :param seed: Random seed.
+    :return: Term names, in order of their CURIEs ('SYNTH:<index>').
+    """
+    rng = random.Random(seed)
+    names: List[str] = []
+    seen = set()
+    while len(names) < n_terms:
+        name = " ".join(make_word(rng) for _ in range(rng.randint(1, 3)))
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+
+    with open(path, "w") as f:
+        f.write("id\tcategory\tname\tprovided_by\tsynonym\n")
+        for i, name in enumerate(names):
+            synonym = make_word(rng) if rng.random() < synonym_rate else ""
+            f.write(f"SYNTH:{i}\t{CATEGORY}\t{name}\t{ORIGIN}\t{synonym}\n")
+    return names
+
+
+def write_edges(path: str, n_terms: int, seed: int = 0) -> None:
+    """Write a KGX edges TSV of a random subclass hierarchy.
+
+    Every term but the root has a parent with a lower index, and a
+    tenth of them a second one.
+
+    :param path: Output file path.
+    :param n_terms: Number of terms.
+    :param seed: Random seed.
+    """
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        f.write("id\tsubject\tpredicate\tobject\trelation\tknowledge_source\n")
+        for i in range(1, n_terms):
+            parents = {rng.randrange(i)}
+            if rng.random() < 0.1:
+                parents.add(rng.randrange(i))
+            for parent in sorted(parents):
+                f.write(
+                    f"e{i}_{parent}\tSYNTH:{i}\tbiolink:subclass_of\tSYNTH:{parent}"
+                    f"\trdfs:subClassOf\t{ORIGIN}\n"
+                )
+
+
+def write_documents(
+    path: str,
+    n_docs: int,
+    terms: List[str],
+    match_density: float,
+    words_per_doc: int = 200,
+    seed: int = 0,
+) -> List[Tuple[int, int, int, int]]:
+    """Write a TSV of documents ('id' and 'text') mentioning terms.
+
+    :param path: Output file path.
+    :param n_docs: Number of documents.
+    :param terms: Terms mentioned in the documents.
+    :param match_density: Fraction of the words of a document that are terms.
+    :param words_per_doc: Number of words (or terms) per document.
+    :param seed: Random seed.
+    :return: Mentions as (document id, term index, start, end) tuples.
+    """
+    rng = random.Random(seed)
+    fillers = [make_word(rng) for _ in range(2000)]
+    mentions = []
+    with open(path, "w") as f:
+        f.write("id\ttext\n")
+        for doc_id in range(n_docs):
+            words = []
+            offset = 0
+            for position in range(words_per_doc):
+                if rng.random() < match_density:
+                    term_index = rng.randrange(len(terms))
+                    word = terms[term_index]
+                    mentions.append((doc_id, term_index, offset, offset + len(word)))
+                else:
+                    word = rng.choice(fillers)
+                if position % 20 == 19:
+                    word += "."
+                words.append(word)
+                offset += len(word) + 1
+            f.write(f"{doc_id}\t{' '.join(words)}\n")
+    return mentions
+
+
+def write_oger_output(
+    path: str, mentions: List[Tuple[int, int, int, int]], terms: List[str]
+) -> None:
+    """Write mentions the way OGER exports them as TSV.
+
+    :param path: Output file path.
+    :param mentions: Mentions as returned by write_documents.
+    :param terms: Terms the mentions refer to.
+    """
+    with open(path, "w") as f:
+        f.write(
+            "Document ID\tType\tStart Position\tEnd Position\tMatched Term"
+            "\tPreferred Form\tEntity ID\tZone\tSentence ID\tOrigin\tUMLS CUI\n"
+        )
+        for doc_id, term_index, start, end in mentions:
+            term = terms[term_index]
+            f.write(
+                f"{doc_id}\t{CATEGORY}\t{start}\t{end}\t{term}\t{term}"
+                f"\tSYNTH:{term_index}\ttext\tS1\t{ORIGIN}\tCUI-less\n"
+            )
@@ -23,12 +23,13 @@ DATA_DIR = join(PARENT_DIR, DATA_DIR_NAME)
 IMAGE_DIR = join(DATA_DIR, IMAGES_DIR_NAME)
 OUTPUT_DIR = join(DATA_DIR, OUTPUT_DIR_NAME)
 SERIAL_DIR = join(DATA_DIR, SERIAL_DIR_NAME)
-ONTO_TERMS_FILENAME = "onto_termlist.tsv"
-TERMS_PICKLED_FILENAME = "terms.pickle"
-PATTERN_LIST_PICKLED_FILENAME = "patterns.pickle"
-PHRASE_MATCHER_PICKLED_FILENAME = "phrase_matcher.pickle"
+TERM_INDEX_DIR_NAME = "term_index"
 SETTINGS_FILENAME = "settings.ini"
 STOPWORDS_FILENAME = "stopWords.txt"
+FINGERPRINT_FILENAME = "fingerprint.json"
+TERMLIST_MANIFEST_FILENAME = "termlist_manifest.json"
+# Output formats of NER results, by file extension.
+OUTPUT_FORMATS = {"tsv": ".tsv", "parquet": ".parquet", "arrow": ".arrow"}
 
 SETTINGS_FILE_PATH = join(dirname(__file__), SETTINGS_FILENAME)
 
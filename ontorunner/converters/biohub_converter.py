@@ -1,10 +1,28 @@
 """Biohub convertor."""
+import io
+import json
 import logging
+import multiprocessing
+import os
+from glob import glob
+from itertools import islice
+from typing import Dict, List, Tuple
+
+from ontorunner import TERMLIST_MANIFEST_FILENAME
+from ontorunner.utils import (get_file_fingerprint, imap_bounded,
+                              is_fingerprint_current)
 
 EXCLUDE = ["biolink:Publication"]
+NODES_SUFFIX = "_nodes.tsv"
+TERMLIST_SUFFIX = "_termlist.tsv"
+SKIP_REASONS = ["excluded_category", "missing_name"]
+DEFAULT_CHUNK_SIZE = 100_000
+WRITE_BUFFER_SIZE = 1 << 20
 
 
-def parse(input_filename, output_filename) -> None:
+def parse(
+    input_filename, output_filename, workers: int = 1, chunk_size=DEFAULT_CHUNK_SIZE
+) -> Dict[str, int]:
     """
     Parse the typical KGX tsv nodes into Bio Term Hub format for compatibility with OGER.
 
@@ -16,62 +34,148 @@ def parse(input_filename, output_filename) -> None:
     -   [4] name -> preferred form
     -   [5] category -> type
 
+    Nodes are converted in chunks of `chunk_size` lines across `workers`
+    processes and written in their original order. Skipped lines are
+    counted instead of being reported one by one.
+
     :param input_filename: (str) Input file path.
     :param output_filename: (str) Output file path.
-    :return: None.
+    :param workers: Number of worker processes (default = 1).
+    :param chunk_size: Number of lines per chunk.
+    :return: Number of skipped lines per reason in SKIP_REASONS.
     """
-    counter = 0
-    outstream = open(output_filename, "w+")
-    header_dict = None
-
-    with open(input_filename) as fh:
-        for line in fh:
-            if counter == 0:
-                header = line.rstrip().split("\t")
-                header_dict = parse_header(header)
-                counter += 1
-                continue
-
-            elements = [x.rstrip() for x in line.split("\t")]
-            if any(x in elements[header_dict["category"]] for x in EXCLUDE):
-                # 'category' field is one of the ones in EXCLUDE list
-                logging.info(
-                    f"Skipping line as part \
-                               of excludes: {line.rstrip()}"
-                )
-                continue
-
-            if not elements[header_dict["name"]]:
-                # no 'name' field for record
-                print(
-                    f"Skipping line as it does not \
-                      have a name field: {line.rstrip()}"
-                )
-                continue
-
-            parsed_record = list()
-            parsed_record.append("CUI-less")
-            if "provided_by" in header_dict:
-                parsed_record.append(elements[header_dict["provided_by"]])
+    skipped = dict.fromkeys(SKIP_REASONS, 0)
+
+    with open(input_filename) as fh, open(
+        output_filename, "w", buffering=WRITE_BUFFER_SIZE
+    ) as outstream:
+        header_dict = parse_header(fh.readline().rstrip().split("\t"))
+        tasks = (
+            (header_dict, lines)
+            for lines in iter(lambda: list(islice(fh, chunk_size)), [])
+        )
+        pool = multiprocessing.Pool(workers) if workers > 1 else None
+        try:
+            if pool is None:
+                results = map(convert_lines, tasks)
             else:
-                parsed_record.append("N/A")
-            parsed_record.append(elements[header_dict["id"]])
-            parsed_record.append(elements[header_dict["name"]])
-            parsed_record.append(elements[header_dict["name"]])
-            parsed_record.append(elements[header_dict["category"]])
-            if elements[header_dict["synonym"]]:
-                synonyms = elements[header_dict["synonym"]]
-                for s in synonyms.split("|"):
-                    syn_record = [x for x in parsed_record]
-                    syn_record[3] = s
-                    if syn_record[3].lower() != syn_record[4].lower():
-                        syn_record[2] = syn_record[2] + "_SYNONYM"
-                        # Preferred form == Synonym matched
-                        syn_record[4] = (
-                            syn_record[3] + "[SYNONYM_OF:" + syn_record[4] + "]"
-                        )
-                        write_line(syn_record, outstream)
-            write_line(parsed_record, outstream)
+                results = imap_bounded(pool, convert_lines, tasks, 2 * workers)
+            for records, chunk_skipped in results:
+                outstream.write(records)
+                for reason, n in chunk_skipped.items():
+                    skipped[reason] += n
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    if any(skipped.values()):
+        logging.info(f"Skipped lines in {input_filename}: {skipped}")
+    return skipped
+
+
+def parse_directory(
+    input_dir, output_dir, workers: int = 1, force: bool = False
+) -> List[str]:
+    """
+    Generate a termlist for every '*_nodes.tsv' file in a directory.
+
+    A manifest in `output_dir` records the fingerprint of the nodes file
+    each termlist was generated from, so only the termlists whose nodes
+    file changed (or that are missing) are regenerated.
+
+    :param input_dir: (str) Directory of KGX nodes files.
+    :param output_dir: (str) Directory of termlists ('*_termlist.tsv').
+    :param workers: Number of worker processes (default = 1).
+    :param force: Regenerate every termlist.
+    :return: Paths of the regenerated termlists.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, TERMLIST_MANIFEST_FILENAME)
+    manifest = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, "r") as mf:
+            manifest = json.load(mf)
+
+    regenerated = []
+    for nodes_file in sorted(glob(os.path.join(input_dir, "*" + NODES_SUFFIX))):
+        nodes_name = os.path.basename(nodes_file)
+        termlist_name = nodes_name[: -len(NODES_SUFFIX)] + TERMLIST_SUFFIX
+        termlist_file = os.path.join(output_dir, termlist_name)
+        entry = manifest.get(nodes_name)
+        if (
+            not force
+            and entry is not None
+            and entry["termlist"] == termlist_name
+            and os.path.isfile(termlist_file)
+            and is_fingerprint_current(nodes_file, entry["fingerprint"])
+        ):
+            continue
+
+        # Fingerprint before converting: a nodes file that changes
+        # mid-conversion is picked up by the next run.
+        fingerprint = get_file_fingerprint(nodes_file)
+        skipped = parse(nodes_file, termlist_file, workers)
+        manifest[nodes_name] = {
+            "fingerprint": fingerprint,
+            "termlist": termlist_name,
+            "skipped": skipped,
+        }
+        # Saved after every termlist so an interrupted run keeps its progress.
+        with open(manifest_path, "w") as mf:
+            json.dump(manifest, mf, indent=2)
+        regenerated.append(termlist_file)
+
+    return regenerated
+
+
+def convert_lines(task: Tuple[dict, List[str]]) -> Tuple[str, Dict[str, int]]:
+    """
+    Convert lines of a KGX nodes TSV into Bio Term Hub records.
+
+    :param task: Tuple of the parsed header and the lines to convert.
+    :return: Tuple of the converted records and the number of
+        skipped lines per reason in SKIP_REASONS.
+    """
+    header_dict, lines = task
+    outstream = io.StringIO()
+    skipped = dict.fromkeys(SKIP_REASONS, 0)
+
+    for line in lines:
+        elements = [x.rstrip() for x in line.split("\t")]
+        if any(x in elements[header_dict["category"]] for x in EXCLUDE):
+            # 'category' field is one of the ones in EXCLUDE list
+            skipped["excluded_category"] += 1
+            continue
+
+        if not elements[header_dict["name"]]:
+            # no 'name' field for record
+            skipped["missing_name"] += 1
+            continue
+
+        parsed_record = list()
+        parsed_record.append("CUI-less")
+        if "provided_by" in header_dict:
+            parsed_record.append(elements[header_dict["provided_by"]])
+        else:
+            parsed_record.append("N/A")
+        parsed_record.append(elements[header_dict["id"]])
+        parsed_record.append(elements[header_dict["name"]])
+        parsed_record.append(elements[header_dict["name"]])
+        parsed_record.append(elements[header_dict["category"]])
+        if elements[header_dict["synonym"]]:
+            synonyms = elements[header_dict["synonym"]]
+            for s in synonyms.split("|"):
+                syn_record = [x for x in parsed_record]
+                syn_record[3] = s
+                if syn_record[3].lower() != syn_record[4].lower():
+                    syn_record[2] = syn_record[2] + "_SYNONYM"
+                    # Preferred form == Synonym matched
+                    syn_record[4] = syn_record[3] + "[SYNONYM_OF:" + syn_record[4] + "]"
+                    write_line(syn_record, outstream)
+        write_line(parsed_record, outstream)
+
+    return outstream.getvalue(), skipped
 
 
 def parse_header(elements) -> dict:
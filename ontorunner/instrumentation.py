@@ -0,0 +1,211 @@
+"""Per-stage timing and memory instrumentation of a run."""
+import cProfile
+import json
+import logging
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+from time import process_time
+from timeit import default_timer as timer
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+REPORT_COLUMNS = ["stage", "calls", "wall_time", "cpu_time", "peak_rss_mb"]
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    """Get the peak resident set size of this process so far.
+
+    :return: Peak RSS in MB, or None where it cannot be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+class RunReport(object):
+    """Wall time, CPU time, peak RSS and counts per stage of a run.
+
+    Stages run more than once (e.g. once per chunk) are accumulated.
+    Only the current process is measured: stages run in worker
+    processes are not reported.
+    """
+
+    def __init__(self, profile_dir: Optional[str] = None):
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self.stages: Dict[str, dict] = {}
+        self.profile_dir = profile_dir
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self._profiling = False
+
+    def add(self, name: str, wall_time: float, cpu_time: float, **counts) -> None:
+        """Add a measurement to a stage.
+
+        :param name: Stage name.
+        :param wall_time: Wall time in seconds.
+        :param cpu_time: CPU time in seconds.
+        :param counts: Counts (e.g. documents or rows) to add to the stage.
+        """
+        stats = self.stages.setdefault(
+            name, {"stage": name, "calls": 0, "wall_time": 0.0, "cpu_time": 0.0}
+        )
+        stats["calls"] += 1
+        stats["wall_time"] += wall_time
+        stats["cpu_time"] += cpu_time
+        stats["peak_rss_mb"] = get_peak_rss_mb()
+        for key, n in counts.items():
+            stats[key] = stats.get(key, 0) + n
+        logging.info(f"{name}: {wall_time:.2f} seconds.")
+
+    @contextmanager
+    def stage(self, name: str, **counts) -> Iterator[dict]:
+        """Measure a stage.
+
+        Counts only known at the end of the stage can be set on the
+        yielded dictionary. Stages are profiled with cProfile when the
+        report has a `profile_dir`, unless nested in a profiled stage.
+
+        :param name: Stage name.
+        :param counts: Counts known at the start of the stage.
+        :return: Dictionary of counts.
+        """
+        profile = None
+        if self.profile_dir and not self._profiling:
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+            self._profiling = True
+            profile.enable()
+        stage_counts = dict(counts)
+        start_wall, start_cpu = timer(), process_time()
+        try:
+            yield stage_counts
+        finally:
+            wall_time, cpu_time = timer() - start_wall, process_time() - start_cpu
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+            self.add(name, wall_time, cpu_time, **stage_counts)
+
+    def to_records(self) -> List[dict]:
+        """Get the stages in the order they first ran.
+
+        :return: One dictionary per stage.
+        """
+        return list(self.stages.values())
+
+    def save(self, report_file: str) -> None:
+        """Write the report, and the cProfile dumps if profiling.
+
+        :param report_file: JSON ('.json') or TSV file path.
+        """
+        if os.path.dirname(report_file):
+            os.makedirs(os.path.dirname(report_file), exist_ok=True)
+        if report_file.endswith(".json"):
+            with open(report_file, "w") as rf:
+                json.dump(
+                    {"started": self.started, "stages": self.to_records()},
+                    rf,
+                    indent=2,
+                )
+        else:
+            report_df = pd.DataFrame.from_records(self.to_records())
+            count_columns = sorted(set(report_df.columns) - set(REPORT_COLUMNS))
+            report_df.reindex(columns=REPORT_COLUMNS + count_columns).to_csv(
+                report_file, sep="\t", index=None
+            )
+
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            for name, profile in self.profiles.items():
+                profile.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+
+
+class StageTimer(object):
+    """Split the time of a loop between the stages interleaved in it."""
+
+    def __init__(self):
+        self.totals: Dict[str, List[float]] = {}
+        self._wall, self._cpu = timer(), process_time()
+
+    def lap(self, name: str) -> None:
+        """Add the time since the previous lap to a stage.
+
+        :param name: Stage name.
+        """
+        wall, cpu = timer(), process_time()
+        totals = self.totals.setdefault(name, [0.0, 0.0])
+        totals[0] += wall - self._wall
+        totals[1] += cpu - self._cpu
+        self._wall, self._cpu = wall, cpu
+
+    def record(self, **counts) -> None:
+        """Add the stage totals to the run in progress.
+
+        :param counts: Counts to add to every stage.
+        """
+        for name, (wall_time, cpu_time) in self.totals.items():
+            record_stage(name, wall_time, cpu_time, **counts)
+
+
+# Report of the run in progress, if any.
+_ACTIVE_REPORT: Optional[RunReport] = None
+
+
+@contextmanager
+def recording(
+    report_file: Optional[str] = None, profile_dir: Optional[str] = None
+) -> Iterator[RunReport]:
+    """Record the stages of a run.
+
+    A run started within another one (e.g. add_sentence.parse called
+    by run_oger) is recorded into the outer run's report.
+
+    :param report_file: File the report is written to at the end of the run.
+    :param profile_dir: Directory of per-stage cProfile dumps.
+    :return: RunReport object.
+    """
+    global _ACTIVE_REPORT
+    outer_report = _ACTIVE_REPORT
+    report = outer_report or RunReport(profile_dir)
+    _ACTIVE_REPORT = report
+    try:
+        yield report
+    finally:
+        _ACTIVE_REPORT = outer_report
+        if outer_report is None and report_file:
+            report.save(report_file)
+
+
+@contextmanager
+def stage(name: str, **counts) -> Iterator[dict]:
+    """Measure a stage of the run in progress (see RunReport.stage).
+
+    :param name: Stage name.
+    :param counts: Counts known at the start of the stage.
+    :return: Dictionary of counts.
+    """
+    if _ACTIVE_REPORT is None:
+        yield dict(counts)
+    else:
+        with _ACTIVE_REPORT.stage(name, **counts) as stage_counts:
+            yield stage_counts
+
+
+def record_stage(name: str, wall_time: float, cpu_time: float, **counts) -> None:
+    """Add a measurement taken by the caller to the run in progress.
+
+    :param name: Stage name.
+    :param wall_time: Wall time in seconds.
+    :param cpu_time: CPU time in seconds.
+    :param counts: Counts to add to the stage.
+    """
+    if _ACTIVE_REPORT is not None:
+        _ACTIVE_REPORT.add(name, wall_time, cpu_time, **counts)
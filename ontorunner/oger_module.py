@@ -4,11 +4,13 @@ import csv
 import os
 
 import click
-from oger.ctrl.router import PipelineServer, Router
-from oger.ctrl.run import run
 from oger.doc import EXPORTERS
 
-from ontorunner.post import NODE_AND_EDGE_DIR, add_sentence
+from ontorunner import OUTPUT_FORMATS, SERIAL_DIR
+from ontorunner.instrumentation import recording, stage
+from ontorunner.post import NODE_AND_EDGE_DIR
+from ontorunner.server import (DEFAULT_HOST, DEFAULT_MAX_BATCH_SIZE,
+                               DEFAULT_MAX_WAIT, DEFAULT_PORT)
 
 
 def run_oger(
@@ -20,6 +22,11 @@ def run_oger(
     workers=1,
     nodes_and_edges=NODE_AND_EDGE_DIR,
     need_ancestors=False,
+    report_file=None,
+    profile_dir=None,
+    results_format="tsv",
+    serial_dir=SERIAL_DIR,
+    sentence_workers=1,
 ) -> None:
     """Run OGER.
 
@@ -31,49 +38,75 @@ def run_oger(
     are provided in this file and are hence optional.
     Make changes to this file according to project needs
     s(default:'settings.ini').
-    :param workers: Number of parallel threads (default = 1).
+    :param workers: Number of parallel OGER threads (default = 1).
     :param nodes_and_edges: Directory where KGX nodes and edges tsv files.
     :param need_ancestors: Bool to decide if ancestors should be present in
     the output or no.
+    :param report_file: Write per-stage timings (JSON or TSV) to this file.
+    :param profile_dir: Write per-stage cProfile dumps to this directory.
+    :param results_format: Format of the post-processed ('_ontoRunNER')
+    files: tsv (default), parquet or arrow.
+    :param serial_dir: Directory ancestor indices are cached in (None
+    disables caching).
+    :param sentence_workers: Number of processes sentences are added
+    with in post-processing (default = 1).
     :return: None.
     """
-    if settings:
-        config = configparser.ConfigParser()
-        config.read(settings)
-        sections = config._sections
-        settings = sections["Main"]
-        settings["n_workers"] = workers
-        output = settings["output-directory"]
-        input = settings["input-directory"]
-        nodes_and_edges = nodes_and_edges
-        run(**settings)
-
-    else:
-        sniffer = csv.Sniffer()
-        sample_bytes = 128
-        dialect = sniffer.sniff(open(content).readline(sample_bytes))
-        delim = ""
-        if dialect.delimiter == "\t" or dialect.delimiter == ",":
-            delim = "txt_tsv"
+    from oger.ctrl.router import PipelineServer, Router
+    from oger.ctrl.run import run
+
+    from ontorunner.post import add_sentence
+
+    with recording(report_file, profile_dir):
+        if settings:
+            config = configparser.ConfigParser()
+            config.read(settings)
+            sections = config._sections
+            settings = sections["Main"]
+            settings["n_workers"] = workers
+            output = settings["output-directory"]
+            input = settings["input-directory"]
+            nodes_and_edges = nodes_and_edges
+            with stage("oger"):
+                run(**settings)
+
         else:
-            delim = "txt"
-
-        conf = Router(termlist_path=termlist, include_header=True)
-        pl = PipelineServer(conf)
-        doc = pl.load_one(content, delim)
-        pl.process(doc)
-        n = len([x for x in doc.iter_entities()])
-        print(f"Number of recognized entities: {n}")
-        with open(output, "w", encoding="utf8") as f:
-            pl.write(doc, output_format, f)
-        # Add sentence
-        if os.path.isdir(content):
-            input = content
-        elif os.path.isfile(content):
-            input = os.path.dirname(content)
-            output = os.path.dirname(output)
-
-    add_sentence.parse(input, output, nodes_and_edges, need_ancestors)
+            sniffer = csv.Sniffer()
+            sample_bytes = 128
+            dialect = sniffer.sniff(open(content).readline(sample_bytes))
+            delim = ""
+            if dialect.delimiter == "\t" or dialect.delimiter == ",":
+                delim = "txt_tsv"
+            else:
+                delim = "txt"
+
+            conf = Router(termlist_path=termlist, include_header=True)
+            pl = PipelineServer(conf)
+            with stage("oger") as stage_counts:
+                doc = pl.load_one(content, delim)
+                pl.process(doc)
+                n = len([x for x in doc.iter_entities()])
+                stage_counts["rows"] = n
+            print(f"Number of recognized entities: {n}")
+            with stage("export", rows=n):
+                with open(output, "w", encoding="utf8") as f:
+                    pl.write(doc, output_format, f)
+            # Add sentence
+            if os.path.isdir(content):
+                input = content
+            elif os.path.isfile(content):
+                input = os.path.dirname(content)
+                output = os.path.dirname(output)
+
+        add_sentence.parse(
+            input,
+            output,
+            nodes_and_edges,
+            need_ancestors,
+            sentence_workers,
+            results_format,
+            serial_dir,
+        )
 
 
 # os.system('say "Done!"')
@@ -97,7 +130,12 @@ def cli():
     "--output-format", "-f", type=click.Choice(EXPORTERS), default="bioc_json"
 )
 @click.option("--settings", "-s", type=click.Path(exists=True))
-@click.option("--workers", "-w", default=1)
+@click.option("--workers", "-w", default=1, help="Number of OGER threads.")
+@click.option(
+    "--sentence-workers",
+    default=1,
+    help="Number of processes sentences are added with.",
+)
 @click.option(
     "--nodes-and-edges",
     "-n",
@@ -105,6 +143,11 @@ def cli():
     default=NODE_AND_EDGE_DIR,
 )
 @click.option("--need-ancestors", "-a", type=bool, default=False)
+@click.option("--report", "-r", type=click.Path(), default=None)
+@click.option("--profile-dir", type=click.Path(), default=None)
+@click.option(
+    "--results-format", type=click.Choice(list(OUTPUT_FORMATS)), default="tsv"
+)
 def run_oger_click(
     content,
     termlist,
@@ -112,8 +155,12 @@ def run_oger_click(
     output_format,
     settings,
     workers,
+    sentence_workers,
     nodes_and_edges,
     need_ancestors,
+    report,
+    profile_dir,
+    results_format,
 ):
     """
     Run OGER module using CLI.
@@ -123,11 +170,15 @@ def run_oger_click(
     :param output: Directory fro output.
     :param output_format: Output format [default: tsv].
     :param settings: Filepath for settings.ini file.
-    :param workers: Number of parallel threads.
+    :param workers: Number of parallel OGER threads.
+    :param sentence_workers: Number of processes sentences are added with.
     :param nodes_and_edges: Directory where all KGX
         nodes and edges tsv files reside.
     :param need_ancestors: Bool indicating where output
         should contain ancestors of matched term should be present.
+    :param report: File per-stage timings (.json or .tsv) are written to.
+    :param profile_dir: Directory per-stage cProfile dumps are written to.
+    :param results_format: Format of the post-processed output files.
     """
     run_oger(
         content,
@@ -138,6 +189,43 @@ def run_oger_click(
         workers,
         nodes_and_edges,
         need_ancestors,
+        report,
+        profile_dir,
+        results_format,
+        sentence_workers=sentence_workers,
+    )
+
+
+@cli.command("serve")
+@click.option("--settings", "-s", type=click.Path(exists=True), required=True)
+@click.option("--host", default=DEFAULT_HOST)
+@click.option("--port", type=int, default=DEFAULT_PORT)
+@click.option("--workers", "-w", default=1)
+@click.option("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+@click.option("--max-wait", type=float, default=DEFAULT_MAX_WAIT)
+def serve_click(settings, host, port, workers, max_batch_size, max_wait):
+    """
+    Serve OGER annotation requests over HTTP, keeping the termlist loaded.
+
+    POST {"documents": [{"id": .., "text": ..}]} to /annotate.
+
+    :param settings: Filepath for settings.ini file.
+    :param host: Host to listen on.
+    :param port: Port to listen on.
+    :param workers: Number of worker processes.
+    :param max_batch_size: Maximum number of documents per batch.
+    :param max_wait: Seconds a request waits for others to batch with.
+    """
+    from ontorunner.server import OgerBackend, serve
+
+    serve(
+        OgerBackend(settings),
+        {"settings": settings},
+        host,
+        port,
+        workers,
+        max_batch_size,
+        max_wait,
     )
 
 
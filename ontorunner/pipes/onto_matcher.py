@@ -0,0 +1,205 @@
+"""Pipeline component matching termlist terms in a Doc."""
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from spacy.language import Language
+from spacy.matcher import PhraseMatcher
+from spacy.strings import hash_string
+from spacy.tokens import Doc, Span
+from spacy.vocab import Vocab
+
+from ontorunner.pipes.term_index import TERM_COLUMNS, TermIndex
+
+TERM_EXTENSIONS = [
+    "object_id",
+    "object_category",
+    "object_label",
+    "object_match_field",
+    "origin",
+]
+
+
+class OntoMatcher(object):
+    """Match terms once per Doc and annotate the matched spans.
+
+    Terms are rows of the interned table of a TermIndex. The terms
+    sharing a surface form (lowercased matched term) are all kept, as
+    grouped by the TermForms of the index.
+
+    Every match gets the id of its surface form as the `form_id` Span
+    extension, the ids of all its terms as `term_ids` and their metadata
+    as `term_records`. The term metadata extensions (object_id, origin,
+    etc.) are those of its first term. Matches that do not overlap the
+    entities already in the Doc (or a longer match) are added to
+    `doc.ents`, labelled 'CURIE [ label ]' after their first term.
+    """
+
+    def __init__(self, vocab: Vocab, name: str, attr: str, label: str):
+        self.name = name
+        self.label = label
+        self.attr = attr
+        self.strings: Sequence[str] = []
+        self.table = np.zeros((0, len(TERM_COLUMNS)), dtype=np.int32)
+        # Sorted hashes of the surface forms.
+        self.form_keys = np.zeros(0, dtype=np.uint64)
+        self.form_offsets = np.zeros(1, dtype=np.int64)
+        self.form_term_ids = np.zeros(0, dtype=np.int32)
+        self.phrase_matcher = PhraseMatcher(vocab, attr=attr)
+
+        Span.set_extension("form_id", default=None, force=True)
+        Span.set_extension(
+            "term_ids",
+            getter=lambda span: self.get_term_ids(span._.form_id),
+            force=True,
+        )
+        Span.set_extension(
+            "term_records",
+            getter=lambda span: [self.get_term(i) for i in span._.term_ids],
+            force=True,
+        )
+        Span.set_extension(
+            "term_id",
+            getter=lambda span: next(iter(span._.term_ids), None),
+            force=True,
+        )
+        Span.set_extension(
+            "is_an_ontology_term",
+            getter=lambda span: span._.form_id is not None,
+            force=True,
+        )
+        for extension in TERM_EXTENSIONS:
+            Span.set_extension(
+                extension, getter=self._get_term_getter(extension), force=True
+            )
+
+    def __len__(self) -> int:
+        return len(self.form_term_ids)
+
+    def _get_term_getter(self, column: str) -> Callable[[Span], str]:
+        column_index = TERM_COLUMNS.index(column)
+
+        def getter(span: Span):
+            term_id = span._.term_id
+            if term_id is None:
+                return False
+            return self.strings[self.table[term_id, column_index]]
+
+        return getter
+
+    def load_term_index(self, term_index: TermIndex) -> None:
+        """Replace the terms matched with those of a term index.
+
+        The term tables are used as is, so a memory-mapped index stays
+        shared with the other processes mapping it. The PhraseMatcher is
+        built from the term Docs and is private to the process, unless
+        inherited copy-on-write by forked workers.
+
+        :param term_index: TermIndex object.
+        """
+        self.strings = term_index.strings
+        self.table = term_index.table
+        self.form_keys, self.form_offsets, self.form_term_ids = term_index.forms
+
+        self.phrase_matcher = PhraseMatcher(self.phrase_matcher.vocab, attr=self.attr)
+        self.phrase_matcher.add(self.label, term_index.docs)
+
+    def get_term_ids(self, form_id: Optional[int]) -> List[int]:
+        """Get the ids of the terms of a surface form.
+
+        :param form_id: Surface form id (None for no form).
+        :return: Term ids, in termlist order.
+        """
+        if form_id is None:
+            return []
+        return self.form_term_ids[
+            self.form_offsets[form_id] : self.form_offsets[form_id + 1]
+        ].tolist()
+
+    def get_term(self, term_id: int) -> Dict[str, str]:
+        """Get the metadata of a term.
+
+        :param term_id: Term id.
+        :return: Dictionary keyed by TERM_COLUMNS.
+        """
+        return {
+            col: self.strings[i]
+            for col, i in zip(TERM_COLUMNS, self.table[term_id].tolist())
+        }
+
+    def get_entity_label(self, term_id: int) -> str:
+        """Get the entity label of a term.
+
+        :param term_id: Term id.
+        :return: Label as 'CURIE [ label ]'.
+        """
+        object_id, object_label = (
+            self.strings[self.table[term_id, TERM_COLUMNS.index(col)]]
+            for col in ["object_id", "object_label"]
+        )
+        return object_id.replace("_SYNONYM", "") + " [ " + object_label + " ]"
+
+    def match_forms(self, doc: Doc) -> List[Tuple[int, int, int]]:
+        """Match surface forms in a Doc.
+
+        :param doc: Doc object.
+        :return: (form id, start, end) tuples.
+        """
+        matches = self.phrase_matcher(doc)
+        if not matches or not len(self.form_keys):
+            return []
+        keys = np.array(
+            [hash_string(doc[start:end].text.lower()) for _, start, end in matches],
+            dtype=np.uint64,
+        )
+        positions = np.searchsorted(self.form_keys, keys)
+        positions[positions == len(self.form_keys)] = 0
+        found = self.form_keys[positions] == keys
+        return [
+            (form_id, start, end)
+            for (_, start, end), form_id, is_found in zip(
+                matches, positions.tolist(), found.tolist()
+            )
+            if is_found
+        ]
+
+    def match(self, doc: Doc) -> List[Tuple[int, int, int]]:
+        """Match terms in a Doc, with one match per term of a surface form.
+
+        :param doc: Doc object.
+        :return: (term id, start, end) tuples.
+        """
+        return [
+            (term_id, start, end)
+            for form_id, start, end in self.match_forms(doc)
+            for term_id in self.get_term_ids(form_id)
+        ]
+
+    def __call__(self, doc: Doc) -> Doc:
+        matches = sorted(
+            set(self.match_forms(doc)),
+            key=lambda m: (m[2] - m[1], -m[1]),
+            reverse=True,
+        )
+        entities = list(doc.ents)
+        new_entities = []
+        seen_tokens = set()
+        for form_id, start, end in matches:
+            Span(doc, start, end)._.set("form_id", form_id)
+            if any(t.ent_type for t in doc[start:end]) or seen_tokens.intersection(
+                range(start, end)
+            ):
+                continue
+            term_id = self.form_term_ids[self.form_offsets[form_id]]
+            new_entities.append(
+                Span(doc, start, end, label=self.get_entity_label(term_id))
+            )
+            seen_tokens.update(range(start, end))
+        if new_entities:
+            doc.ents = entities + new_entities
+        return doc
+
+
+@Language.factory("onto_matcher", default_config={"attr": "LOWER", "label": "ontology"})
+def make_onto_matcher(nlp: Language, name: str, attr: str, label: str):
+    """Make an OntoMatcher. Its terms are added with `load_term_index`."""
+    return OntoMatcher(nlp.vocab, name, attr, label)
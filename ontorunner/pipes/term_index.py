@@ -0,0 +1,438 @@
+"""Serialized term index used by OntoRuler."""
+import hashlib
+import json
+import os
+import shutil
+from typing import (Callable, Dict, Iterable, Iterator, List, NamedTuple,
+                    Optional, Sequence)
+
+import numpy as np
+import spacy
+from spacy.strings import hash_string
+from spacy.tokens import Doc, DocBin
+from spacy.vocab import Vocab
+
+from ontorunner.utils import get_file_fingerprint, is_fingerprint_current
+
+TERM_INDEX_FORMAT_VERSION = 3
+TERM_INDEX_MANIFEST_FILENAME = "manifest.json"
+# Index of all termlists, memory-mapped by every process using it.
+TERM_INDEX_COMBINED_DIR_NAME = "_combined"
+TERM_INDEX_META_FILENAME = "meta.json"
+TERM_INDEX_STRINGS_FILENAME = "strings.bin"
+TERM_INDEX_STRING_OFFSETS_FILENAME = "string_offsets.npy"
+TERM_INDEX_TABLE_FILENAME = "terms.npy"
+TERM_INDEX_FORM_FILENAMES = ["form_keys.npy", "form_offsets.npy", "form_term_ids.npy"]
+TERM_INDEX_DOCS_FILENAME = "pattern_docs.spacy"
+
+TERM_COLUMNS = [
+    "matched_term",
+    "object_id",
+    "object_category",
+    "object_label",
+    "object_match_field",
+    "origin",
+]
+
+
+class MappedStrings(Sequence[str]):
+    """Read-only string table decoded on access from a UTF-8 buffer.
+
+    The buffer and offsets are typically memory-mapped, so that the
+    processes using the table share one copy of it.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("string index out of range")
+        return self.blob[self.offsets[i] : self.offsets[i + 1]].tobytes().decode()
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+
+class TermForms(NamedTuple):
+    """Terms grouped by surface form (lowercased matched term).
+
+    The ids of the terms of form i are
+    `term_ids[offsets[i]:offsets[i + 1]]`.
+    """
+
+    keys: np.ndarray  # Sorted hashes of the surface forms.
+    offsets: np.ndarray
+    term_ids: np.ndarray
+
+
+def get_term_forms(strings: Sequence[str], table: np.ndarray) -> TermForms:
+    """Group terms by surface form.
+
+    Terms only differing from another term of their surface form
+    by the case of their matched term are dropped.
+
+    :param strings: String table.
+    :param table: Term table.
+    :return: TermForms object.
+    """
+    matched_term_index = TERM_COLUMNS.index("matched_term")
+    keys = np.fromiter(
+        (
+            hash_string(strings[i].lower())
+            for i in table[:, matched_term_index].tolist()
+        ),
+        dtype=np.uint64,
+        count=len(table),
+    )
+    form_keys, form_ids = np.unique(keys, return_inverse=True)
+
+    term_ids = np.arange(len(table))
+    if len(table):
+        # First term of each distinct (surface form, metadata) pair.
+        _, term_ids = np.unique(
+            np.column_stack([form_ids, np.delete(table, matched_term_index, axis=1)]),
+            axis=0,
+            return_index=True,
+        )
+        term_ids.sort()
+    term_ids = term_ids[np.argsort(form_ids[term_ids], kind="stable")]
+    return TermForms(
+        form_keys,
+        np.searchsorted(form_ids[term_ids], np.arange(len(form_keys) + 1)),
+        term_ids.astype(np.int32),
+    )
+
+
+def _replace_file(path: str, write: Callable[[str], None]) -> None:
+    # Processes mapping the previous file keep reading it, rather than
+    # one truncated under them.
+    write(path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    def write(tmp_path: str) -> None:
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+
+    _replace_file(path, write)
+
+
+class TermIndex(object):
+    """Term dictionary compiled from termlists.
+
+    Every term is a row of ids into a shared string table, one per
+    column in TERM_COLUMNS, alongside the tokenized Doc of its matched term.
+    """
+
+    def __init__(
+        self,
+        strings: Sequence[str],
+        table: np.ndarray,
+        docs: List[Doc],
+        forms: Optional[TermForms] = None,
+    ):
+        self.strings = strings
+        self.table = table
+        self.docs = docs
+        self._forms = forms
+
+    @property
+    def forms(self) -> TermForms:
+        """Terms grouped by surface form."""
+        if self._forms is None:
+            self._forms = get_term_forms(self.strings, self.table)
+        return self._forms
+
+    @classmethod
+    def from_records(
+        cls, records: Iterable[Dict[str, str]], docs: List[Doc]
+    ) -> "TermIndex":
+        """Intern term records into a string table.
+
+        :param records: Dictionaries keyed by TERM_COLUMNS.
+        :param docs: Doc of the matched term of each record.
+        :return: TermIndex object.
+        """
+        string_ids: Dict[str, int] = {}
+        rows = [
+            [string_ids.setdefault(r[col], len(string_ids)) for col in TERM_COLUMNS]
+            for r in records
+        ]
+        table = np.array(rows, dtype=np.int32).reshape(-1, len(TERM_COLUMNS))
+        return cls(list(string_ids), table, docs)
+
+    @classmethod
+    def concat(cls, term_indexes: Iterable["TermIndex"]) -> "TermIndex":
+        """Combine term indexes into one, merging their string tables.
+
+        :param term_indexes: TermIndex objects.
+        :return: TermIndex object.
+        """
+        string_ids: Dict[str, int] = {}
+        tables = [np.zeros((0, len(TERM_COLUMNS)), dtype=np.int32)]
+        docs: List[Doc] = []
+        for term_index in term_indexes:
+            new_ids = np.array(
+                [string_ids.setdefault(s, len(string_ids)) for s in term_index.strings],
+                dtype=np.int32,
+            )
+            tables.append(new_ids[term_index.table])
+            docs.extend(term_index.docs)
+        return cls(list(string_ids), np.concatenate(tables), docs)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def records(self) -> Iterable[Dict[str, str]]:
+        """Iterate over term records in compilation order.
+
+        :return: Dictionaries keyed by TERM_COLUMNS.
+        """
+        for row in self.table.tolist():
+            yield {col: self.strings[i] for col, i in zip(TERM_COLUMNS, row)}
+
+    def to_disk(self, index_dir: str, fingerprint: str) -> None:
+        """Serialize the index.
+
+        The metadata file is written last so that an interrupted
+        write is detected as a stale index.
+
+        :param index_dir: Destination directory.
+        :param fingerprint: Fingerprint of the source termlist.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        meta_path = os.path.join(index_dir, TERM_INDEX_META_FILENAME)
+        if os.path.isfile(meta_path):
+            os.remove(meta_path)
+
+        encoded = [s.encode("utf-8") for s in self.strings]
+        string_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=string_offsets[1:])
+
+        def write_strings(path: str) -> None:
+            with open(path, "wb") as sf:
+                sf.write(b"".join(encoded))
+
+        _replace_file(
+            os.path.join(index_dir, TERM_INDEX_STRINGS_FILENAME), write_strings
+        )
+        _save_array(
+            os.path.join(index_dir, TERM_INDEX_STRING_OFFSETS_FILENAME), string_offsets
+        )
+        _save_array(os.path.join(index_dir, TERM_INDEX_TABLE_FILENAME), self.table)
+        for fn, array in zip(TERM_INDEX_FORM_FILENAMES, self.forms):
+            _save_array(os.path.join(index_dir, fn), array)
+        doc_bin = DocBin(attrs=["ORTH"], docs=self.docs)
+        _replace_file(
+            os.path.join(index_dir, TERM_INDEX_DOCS_FILENAME), doc_bin.to_disk
+        )
+
+        with open(meta_path, "w") as mf:
+            json.dump(
+                {
+                    "format_version": TERM_INDEX_FORMAT_VERSION,
+                    "fingerprint": fingerprint,
+                    "n_terms": len(self),
+                },
+                mf,
+            )
+
+    @staticmethod
+    def is_current(index_dir: str, fingerprint: str) -> bool:
+        """Check that a serialized index is complete and current.
+
+        :param index_dir: Directory the index was serialized to.
+        :param fingerprint: Fingerprint of the source termlist.
+        :return: Boolean.
+        """
+        meta_path = os.path.join(index_dir, TERM_INDEX_META_FILENAME)
+        if not os.path.isfile(meta_path):
+            return False
+        with open(meta_path, "r") as mf:
+            meta = json.load(mf)
+        return (
+            meta.get("format_version") == TERM_INDEX_FORMAT_VERSION
+            and meta.get("fingerprint") == fingerprint
+        )
+
+    @classmethod
+    def from_disk(
+        cls,
+        index_dir: str,
+        vocab: Vocab,
+        fingerprint: str,
+        mmap_mode: Optional[str] = None,
+    ) -> Optional["TermIndex"]:
+        """Load a serialized index if it is current.
+
+        :param index_dir: Directory the index was serialized to.
+        :param vocab: Vocab to rebuild the term Docs with.
+        :param fingerprint: Fingerprint of the source termlist.
+        :param mmap_mode: 'r' to memory-map the string and term tables
+            rather than reading them into memory.
+        :return: TermIndex object, or None if missing or stale.
+        """
+        if not cls.is_current(index_dir, fingerprint):
+            if os.path.isdir(index_dir):
+                print("Serialized term index is stale and will be rebuilt.")
+            return None
+
+        strings_path = os.path.join(index_dir, TERM_INDEX_STRINGS_FILENAME)
+        string_offsets = np.load(
+            os.path.join(index_dir, TERM_INDEX_STRING_OFFSETS_FILENAME),
+            mmap_mode=mmap_mode,
+        )
+        if mmap_mode is not None and os.path.getsize(strings_path):
+            strings = MappedStrings(
+                np.memmap(strings_path, dtype=np.uint8, mode=mmap_mode),
+                string_offsets,
+            )
+        else:
+            with open(strings_path, "rb") as sf:
+                blob = sf.read()
+            strings = [
+                blob[start:end].decode("utf-8")
+                for start, end in zip(
+                    string_offsets[:-1].tolist(), string_offsets[1:].tolist()
+                )
+            ]
+        table = np.load(
+            os.path.join(index_dir, TERM_INDEX_TABLE_FILENAME), mmap_mode=mmap_mode
+        )
+        forms = TermForms(
+            *(
+                np.load(os.path.join(index_dir, fn), mmap_mode=mmap_mode)
+                for fn in TERM_INDEX_FORM_FILENAMES
+            )
+        )
+        doc_bin = DocBin().from_disk(os.path.join(index_dir, TERM_INDEX_DOCS_FILENAME))
+        return cls(strings, table, list(doc_bin.get_docs(vocab)), forms)
+
+
+def get_partition_name(termlist_path: str) -> str:
+    """Get the name of the term index partition of a termlist.
+
+    :param termlist_path: Termlist file path.
+    :return: Partition (directory) name.
+    """
+    return os.path.splitext(os.path.basename(termlist_path))[0]
+
+
+def load_partitioned_term_index(
+    index_dir: str,
+    termlist_paths: List[str],
+    vocab: Vocab,
+    attr: str,
+    compile_termlist: Callable[[str], TermIndex],
+    to_disk: bool = True,
+) -> TermIndex:
+    """Load the term index of termlists, compiling only the changed ones.
+
+    The index is partitioned per termlist. A manifest in `index_dir`
+    records the fingerprint of the termlist each partition was compiled
+    from, so only the partitions of new or changed termlists are
+    compiled. Partitions of termlists no longer listed are deleted.
+
+    When serialized, the partitions are also combined into one index
+    that is returned memory-mapped: the processes loading it (e.g.
+    spaCy workers) share one copy of its string and term tables. The
+    term Docs are not shared: every process loading the index
+    deserializes them to build its own PhraseMatcher.
+
+    :param index_dir: Directory of the partitions and their manifest.
+    :param termlist_paths: Termlist file paths.
+    :param vocab: Vocab to rebuild the term Docs with.
+    :param attr: Token attribute the PhraseMatcher matches on.
+    :param compile_termlist: Function compiling the TermIndex of a termlist.
+    :param to_disk: Serialize the compiled partitions.
+    :return: TermIndex of all termlists, in the order given.
+    """
+    manifest_path = os.path.join(index_dir, TERM_INDEX_MANIFEST_FILENAME)
+    version = f"{TERM_INDEX_FORMAT_VERSION}:{spacy.__version__}:{attr}"
+    partitions = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, "r") as mf:
+            manifest = json.load(mf)
+        if manifest.get("version") == version:
+            partitions = manifest["partitions"]
+
+    names = [get_partition_name(path) for path in termlist_paths]
+    compiled: Dict[str, TermIndex] = {}
+    for name, termlist_path in zip(names, termlist_paths):
+        entry = partitions.get(name)
+        if (
+            entry is not None
+            and is_fingerprint_current(termlist_path, entry["fingerprint"])
+            and TermIndex.is_current(
+                os.path.join(index_dir, name), entry["fingerprint"]["sha256"]
+            )
+        ):
+            continue
+        # Fingerprint before compiling: a termlist that changes
+        # mid-compilation is picked up by the next run.
+        fingerprint = get_file_fingerprint(termlist_path)
+        compiled[name] = compile_termlist(termlist_path)
+        partitions[name] = {
+            "termlist": os.path.basename(termlist_path),
+            "fingerprint": fingerprint,
+            "n_terms": len(compiled[name]),
+        }
+        if to_disk:
+            compiled[name].to_disk(os.path.join(index_dir, name), fingerprint["sha256"])
+
+    if compiled:
+        print(f"Compiled term index partitions: {', '.join(compiled)}")
+    else:
+        print("Found serialized term index!")
+
+    def load_partition(name: str) -> TermIndex:
+        if name in compiled:
+            return compiled[name]
+        return TermIndex.from_disk(
+            os.path.join(index_dir, name),
+            vocab,
+            partitions[name]["fingerprint"]["sha256"],
+        )
+
+    def load_partitions() -> TermIndex:
+        return TermIndex.concat(load_partition(name) for name in names)
+
+    if not to_disk:
+        return load_partitions()
+
+    os.makedirs(index_dir, exist_ok=True)
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if os.path.isdir(path) and name not in names + [TERM_INDEX_COMBINED_DIR_NAME]:
+            shutil.rmtree(path)
+        elif os.path.isfile(path) and name != TERM_INDEX_MANIFEST_FILENAME:
+            # Left over from an unpartitioned index.
+            os.remove(path)
+    with open(manifest_path, "w") as mf:
+        json.dump(
+            {
+                "version": version,
+                "partitions": {name: partitions[name] for name in names},
+            },
+            mf,
+            indent=2,
+        )
+
+    combined_dir = os.path.join(index_dir, TERM_INDEX_COMBINED_DIR_NAME)
+    sha = hashlib.sha256()
+    for name in names:
+        sha.update(f"{name}:{partitions[name]['fingerprint']['sha256']}".encode())
+    combined_fingerprint = sha.hexdigest()
+    if not TermIndex.is_current(combined_dir, combined_fingerprint):
+        load_partitions().to_disk(combined_dir, combined_fingerprint)
+    return TermIndex.from_disk(combined_dir, vocab, combined_fingerprint, mmap_mode="r")
@@ -8,3 +8,42 @@ NODE_AND_EDGE_NAME = "nodes_and_edges"
 NODE_AND_EDGE_DIR = os.path.join(DATA_DIR, NODE_AND_EDGE_NAME)
 SUBCLASS_PREDICATE = "biolink:subclass_of"
 SUBCLASS_RELATION = "rdfs:subClassOf"
+ANCESTOR_CACHE_DIR_NAME = "ancestors"
+
+# NLTK resources used in post-processing, by download id and data path.
+NLTK_RESOURCES = {
+    "wordnet": "corpora/wordnet",
+    "punkt": "tokenizers/punkt",
+    "punkt_tab": "tokenizers/punkt_tab",
+    "omw-1.4": "corpora/omw-1.4",
+    "averaged_perceptron_tagger": "taggers/averaged_perceptron_tagger",
+    "maxent_ne_chunker": "chunkers/maxent_ne_chunker",
+    "words": "corpora/words",
+}
+
+# Compact dtypes of NER result columns: categories for the repetitive
+# strs and fixed-width numbers for offsets and scores.
+RESULT_DTYPES = {
+    "object_id": "category",
+    "object_category": "category",
+    "object_match_field": "category",
+    "origin": "category",
+    "POS": "category",
+    "tag": "category",
+    "scispacy_object_category": "category",
+    "match_type": "category",
+    "zone": "category",
+    "sentence_id": "category",
+    "umls_cui": "category",
+    "start": "int32",
+    "end": "int32",
+    "start_position": "int32",
+    "end_position": "int32",
+    "sentence_start": "int32",
+    "sentence_end": "int32",
+    "levenshtein_distance": "int32",
+    "jaccard_index": "float32",
+    "monge_elkan": "float32",
+    "object_label_doc_ratio": "float32",
+    "matched_term_doc_ratio": "float32",
+}
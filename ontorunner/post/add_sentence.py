@@ -1,30 +1,27 @@
 """Add sentences for understanding the context of matched terms."""
 import csv
+import multiprocessing
 import os
-import re
+from bisect import bisect_right
+from functools import lru_cache
 from glob import glob
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 
-import nltk
 import pandas as pd
-import textdistance
-from nltk import ne_chunk, pos_tag, word_tokenize
-from nltk.stem.wordnet import WordNetLemmatizer
-
-from ontorunner.post.util import (consolidate_rows, filter_synonyms,
-                                  get_ancestors, get_column_doc_ratio)
-
-# if not nltk.find("corpora/wordnet"):
-nltk.download("wordnet")
-nltk.download("punkt")
-nltk.download("omw-1.4")
-nltk.download("averaged_perceptron_tagger")  # for GH Actions.
-nltk.download("maxent_ne_chunker")
-nltk.download("words")
 
+from ontorunner import OUTPUT_FORMATS
+from ontorunner.instrumentation import stage
+from ontorunner.post.util import (apply_result_dtypes, consolidate_rows,
+                                  ensure_nltk_resources, filter_synonyms,
+                                  get_ancestors, get_doc_ratios)
+from ontorunner.result_io import ResultWriter, read_results
+from ontorunner.utils import imap_bounded
 
 pd.options.mode.chained_assignment = None  # default='warn'
 
+DEFAULT_SHARD_SIZE = 100
+DEFAULT_WRITE_BATCH_SIZE = 50_000
+
 
 def find_extensions(dr, ext) -> List[str]:
     """Find files with a specific extension.
@@ -36,151 +33,191 @@ def find_extensions(dr, ext) -> List[str]:
     return glob(os.path.join(dr, "*.{}".format(ext)))
 
 
-def sentencify(input_df, output_df, output_fn):
+def clean_text(text: str) -> str:
     """
-    Add relevant sentences to the tokenized term in every row of a pandas DataFrame.
+    Remove characters that would break a TSV row from a text.
 
-    :param df: (DataFrame) pandas DataFrame.
-    :return: None
+    :param text: Text.
+    :return: Cleaned text.
+    """
+    return (
+        text.replace("\t", " ")
+        .replace("\u2028", " ")
+        .replace("\n", "")
+        .replace("\r", "")
+    )
+
+
+def get_sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    Get the character offsets of every sentence in a text.
+
+    :param text: Text.
+    :return: List of (start, end) offsets, in order.
+    """
+    import nltk
+
+    spans = []
+    end = 0
+    for sentence in nltk.sent_tokenize(text):
+        # Sentences are substrings of the text, in order.
+        start = text.find(sentence, end)
+        if start == -1:
+            start = end
+        end = start + len(sentence)
+        spans.append((start, end))
+    return spans or [(0, len(text))]
+
+
+def add_sentences(text: str, sub_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add the sentence of every match in a single document.
+
+    Sentence boundaries are computed once and every match is assigned
+    to the sentence its 'start_position' falls in.
+
+    :param text: Document text.
+    :param sub_df: (DataFrame) NER output rows of the document.
+    :return: sub_df with 'sentence' and 'object_sentence_%' filled in.
     """
-    for _, row in input_df.iterrows():
-        idx = row.id
-        text = row.text
+    import textdistance
+
+    sentence_spans = get_sentence_spans(text)
+    sentence_starts = [start for start, _ in sentence_spans]
+    sentences = []
+    for start_pos in sub_df["start_position"].values:
+        i = max(bisect_right(sentence_starts, int(start_pos)) - 1, 0)
+        start, end = sentence_spans[i]
+        sentences.append(clean_text(text[start:end]))
+
+    sub_df["sentence"] = sentences
+    sub_df["object_sentence_%"] = [
+        1 - textdistance.jaccard.distance(str(term).lower(), sentence.lower())
+        for term, sentence in zip(sub_df["matched_term"].values, sentences)
+    ]
+    return sub_df
+
+
+def _add_sentences_shard(shard: List[Tuple[str, pd.DataFrame]]) -> pd.DataFrame:
+    return pd.concat([add_sentences(text, sub_df) for text, sub_df in shard])
+
+
+def iter_document_shards(
+    input_df: pd.DataFrame, output_df: pd.DataFrame, shard_size: int
+) -> Iterator[List[Tuple[str, pd.DataFrame]]]:
+    """
+    Pair every input document with its NER output rows, in input order.
+
+    :param input_df: (DataFrame) Input documents ('id' and 'text').
+    :param output_df: (DataFrame) NER output.
+    :param shard_size: Number of documents per shard.
+    :return: Lists of (text, rows) tuples.
+    """
+    doc_positions = output_df.groupby("document_id", sort=False).indices
+    shard = []
+    for idx, text in zip(input_df["id"].values, input_df["text"].values):
+        positions = doc_positions.get(idx)
         # Check for text = NaN
-        if text == text:
-            text = (
-                text.replace("\t", " ")
-                .replace("\u2028", " ")
-                .replace("\n", "")
-                .replace(
-                    "\r",
-                    "",
-                )
-                .replace(
-                    ")", " "
-                )  # reason: re.error: unbalanced parenthesis at position x
-                .replace("(", " ")
-            )
-            sent_tok = nltk.sent_tokenize(text)
-            # ** This block is for freq count of term in text
-            # # Calcualte frquencies of words and phrases
-            # word_tok = nltk.word_tokenize(text.lower())
-            # # This gets freq count for each word
-            # word_tok_freq = FreqDist(word_tok)
-            # # This will capture phrases and corresponding frequencies
-            # phrases = dict()
-            # for size in 2, 3, 4, 5:
-            #     phrases[size] = FreqDist(ngrams(word_tok, size))
-
-            sub_df = output_df[output_df["document_id"] == idx]
-            # In certain instances, in spite of the 'matched' and 'preferred'
-            # terms being the same, the term is registered as a synonym by KGX
-            # and hence the biohub_converter codes this with a '_SYNONYM' tag.
-            # In order to counter this, we need to filter these extra rows out.
-            if not sub_df.empty and any(sub_df["object_id"].str.endswith("_SYNONYM")):
-                sub_df = filter_synonyms(sub_df)
-
-            if len(sent_tok) == 1:
-                sub_df["sentence"] = text
-            else:
-                relevant_sents = []
-
-                for i, row2 in sub_df.iterrows():
-                    start_reached = False
-                    end_reached = False
-                    term_of_interest = str(row2["matched_term"])
-                    start_pos = int(row2["start_position"])
-                    if start_pos == 0:
-                        start_reached = True
-                    end_pos = int(row2["end_position"])
-                    if end_pos == len(text):
-                        end_reached = True
-                    if term_of_interest == "nan":
-                        # get just the portion where
-                        # 'matched_term' == 'preferred_form'
-                        # because in case of _SYNONYM,
-                        # there will be extra metadata which
-                        # will not be present in the tokenized sentence.
-                        term_of_interest = str(row2["preferred_form"])
-
-                    relevant_sents = [
-                        x
-                        for x in sent_tok
-                        if re.search(term_of_interest, x, re.IGNORECASE)
-                    ]
-
-                    if relevant_sents == []:
-                        relevant_sents = ["irrelevant token: can be ignored."]
-
-                    list_of_sents = relevant_sents
-                    count = 0
-
-                    while len(list_of_sents) > 1:
-                        count += 1
-                        # This keeps track of the # of times the start_pos
-                        # and/or end_pos are shifted
-                        # Detect the beginning and ending of sentences
-                        # ---------------------
-                        if not start_reached:
-                            start_pos -= 1
-                            for sent in list_of_sents:
-                                if sent.startswith(text[start_pos:end_pos]):
-                                    start_reached = True
-                                elif text[start_pos:end_pos].startswith("."):
-                                    start_pos += 1
-                                    start_reached = True
-
-                        if not end_reached:
-                            end_pos += 1
-                            for sent in list_of_sents:
-                                if sent.endswith(text[start_pos:end_pos]):
-                                    end_reached = True
-                                elif text[start_pos:end_pos].endswith("."):
-                                    end_pos -= 1
-                                    end_reached = True
-                        # -------------------------------------------------------------------
-                        term_of_interest = text[start_pos:end_pos]
-                        print(
-                            f"Doc: {row.id} |"
-                            f" iter: {i} |"
-                            f" count: {count} |"
-                            f" #_of_sent: {len(list_of_sents)}"
-                            f" search_term: {term_of_interest}"
-                        )
+        if positions is None or text != text:
+            continue
+        shard.append((text, output_df.iloc[positions]))
+        if len(shard) >= shard_size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def sentencify(
+    input_df,
+    output_df,
+    output_fn,
+    workers: int = 1,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    write_batch_size: int = DEFAULT_WRITE_BATCH_SIZE,
+):
+    """
+    Add relevant sentences to the tokenized term in every row of a pandas DataFrame.
 
-                        list_of_sents = [
-                            x
-                            for x in relevant_sents
-                            if re.search(term_of_interest.strip(), x)
-                        ]
-
-                        if count > 30 and 1 < len(list_of_sents):
-                            list_of_sents = [list_of_sents[0]]
-                            count = 0
-                            break
-                        # Reason for the break:
-                        # In some instance the sentences are repeated.
-                        # In such cases the expanding window with start_pos and
-                        # end_pos goes expanding after 30 character match
-                        # (arbitrary) we take the first element out of the
-                        # common terms and take that as the SENTENCE
-                        # and then 'break'-ing out of the 'while' loop.
-                        # Else, it'll continue looking for the unique
-                        # sentence forever. It's a hack but for now it'll
-                        # do until severe consequences detected.
-
-                    sub_df.loc[i, "sentence"] = list_of_sents[0]
-
-            if not sub_df.empty:
-                sub_df["object_sentence_%"] = sub_df.apply(
-                    lambda x: 1
-                    - textdistance.jaccard.distance(
-                        x.matched_term.lower(), x.sentence.lower()
-                    ),
-                    axis=1,
-                )
+    Documents are sharded across a pool of `workers` processes. Results
+    are written in input order, in batches of at least `write_batch_size`
+    rows, either through a ResultWriter or appended to a TSV file
+    through a single file handle.
+
+    :param input_df: (DataFrame) Input documents ('id' and 'text').
+    :param output_df: (DataFrame) NER output.
+    :param output_fn: ResultWriter, or TSV file the rows are appended to.
+    :param workers: Number of worker processes (default = 1).
+    :param shard_size: Number of documents per worker task.
+    :param write_batch_size: Minimum number of rows per write.
+    :return: None
+    """
+    # In certain instances, in spite of the 'matched' and 'preferred'
+    # terms being the same, the term is registered as a synonym by KGX
+    # and hence the biohub_converter codes this with a '_SYNONYM' tag.
+    # In order to counter this, we need to filter these extra rows out.
+    if output_df["object_id"].str.endswith("_SYNONYM", na=False).any():
+        output_df = filter_synonyms(output_df)
+    ensure_nltk_resources(["punkt", "punkt_tab"])
+    shards = iter_document_shards(input_df, output_df, shard_size)
+
+    if isinstance(output_fn, ResultWriter):
+        writer = output_fn
+    else:
+        writer = ResultWriter(output_fn, "tsv", append=True)
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        if pool is None:
+            results = map(_add_sentences_shard, shards)
+        else:
+            results = imap_bounded(pool, _add_sentences_shard, shards, 2 * workers)
+
+        batch: List[pd.DataFrame] = []
+        n_rows = 0
+        for result in results:
+            batch.append(result)
+            n_rows += len(result)
+            if n_rows >= write_batch_size:
+                writer.write(pd.concat(batch))
+                batch, n_rows = [], 0
+        if batch:
+            writer.write(pd.concat(batch))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if writer is not output_fn:
+            writer.close()
+
+
+SIMILARITY_COLUMNS = [
+    "match_type",
+    "levenshtein_distance",
+    "jaccard_index",
+    "monge_elkan",
+]
+
+
+@lru_cache(maxsize=1)
+def _get_lemmatizer():
+    from nltk.stem.wordnet import WordNetLemmatizer
+
+    return WordNetLemmatizer()
+
+
+@lru_cache(maxsize=None)
+def lemmatize(token: str, pos: str = "n") -> str:
+    """
+    Return the (memoized) WordNet lemma of a token.
 
-                sub_df.to_csv(output_fn, mode="a", sep="\t", header=None, index=None)
+    :param token: Token to lemmatize.
+    :type token: str
+    :param pos: WordNet part of speech ('n', 'v', 'a' or 'r').
+    :type pos: str
+    :return: Lemma.
+    :rtype: str
+    """
+    return _get_lemmatizer().lemmatize(token, pos=pos)
 
 
 def get_match_type(token1: str, token2: str) -> str:
@@ -195,44 +232,97 @@ def get_match_type(token1: str, token2: str) -> str:
     :rtype: str
     """
     match = ""
-    lemma = WordNetLemmatizer()
 
     if token1.lower() == token2.lower():
         match = "exact_match"
-    elif lemma.lemmatize(token1) == lemma.lemmatize(token2):
-        # pos = NOUN by default
-        match = "lemmatic_match"
-    elif lemma.lemmatize(token1, pos="v") == lemma.lemmatize(token2, pos="v"):
-        # testing pos = VERB
-        match = "lemmatic_match"
-    elif lemma.lemmatize(token1, pos="a") == lemma.lemmatize(token2, pos="a"):
-        # testing pos = ADJECTIVE
-        match = "lemmatic_match"
-    elif lemma.lemmatize(token1, pos="r") == lemma.lemmatize(token2, pos="r"):
-        # testing pos = ADVERB
+    elif any(
+        # Testing pos = NOUN, VERB, ADJECTIVE and ADVERB in that order.
+        lemmatize(token1, pos) == lemmatize(token2, pos)
+        for pos in ["n", "v", "a", "r"]
+    ):
         match = "lemmatic_match"
 
     return match
 
 
+def get_similarity_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compare 'matched_term' and 'preferred_form' of every row.
+
+    Pairs repeat heavily across documents, so every metric is computed
+    once per unique (lowercased) pair and joined back onto the rows.
+
+    :param df: DataFrame with 'matched_term' and 'preferred_form' columns.
+    :type df: pd.DataFrame
+    :return: DataFrame of SIMILARITY_COLUMNS aligned with the input rows.
+    :rtype: pd.DataFrame
+    """
+    import textdistance
+
+    ensure_nltk_resources(["wordnet", "omw-1.4"])
+    pairs = pd.DataFrame(
+        {
+            "matched_term": df["matched_term"].str.lower(),
+            "preferred_form": df["preferred_form"].str.lower(),
+        }
+    )
+    unique_pairs = pairs.drop_duplicates()
+    features = pd.DataFrame(
+        [
+            (
+                get_match_type(matched_term, preferred_form),
+                textdistance.levenshtein.distance(matched_term, preferred_form),
+                textdistance.jaccard.distance(matched_term, preferred_form),
+                textdistance.monge_elkan.distance(matched_term, preferred_form),
+            )
+            for matched_term, preferred_form in unique_pairs.itertuples(index=False)
+        ],
+        columns=SIMILARITY_COLUMNS,
+    )
+    unique_pairs = pd.concat([unique_pairs.reset_index(drop=True), features], axis=1)
+    features = pairs.merge(
+        unique_pairs, how="left", on=["matched_term", "preferred_form"]
+    )[SIMILARITY_COLUMNS]
+    features.index = df.index
+    return features
+
+
 def parse(
     input_directory: str,
     output_directory: str,
     nodes_and_edges: str,
     need_ancestors: bool,
+    workers: int = 1,
+    output_format: str = "tsv",
+    serial_dir: Optional[str] = None,
 ) -> None:
     """
     Parse OGER output and add sentences of tokenized terms.
 
+    OGER output may also be given as Parquet or Arrow IPC files.
+
     :param input_directory: (str) Input directory path.
     :param output_directory: (str) Output directory path.
     :param nodes_and_edges: (str) Nodes and edges file directory path.
+    :param need_ancestors: Bool to decide if ancestors should be present.
+    :param workers: Number of processes sentences are added with.
+    :param output_format: Format of the '_ontoRunNER' files ('tsv',
+        'parquet' or 'arrow').
+    :param serial_dir: Directory ancestor indices are cached in (None
+        disables caching).
     :return: None.
     """
+    from nltk import ne_chunk, pos_tag, word_tokenize
+
+    ensure_nltk_resources()
     # Get a list of potential input files for particular formats
     input_list_tsv = find_extensions(input_directory, "tsv")
     input_list_txt = find_extensions(input_directory, "txt")
-    output_files = find_extensions(output_directory, "tsv")
+    output_files = [
+        fn
+        for extension in OUTPUT_FORMATS.values()
+        for fn in find_extensions(output_directory, extension.lstrip("."))
+    ]
     output_file_list = [
         x
         for x in output_files
@@ -240,87 +330,52 @@ def parse(
         if "_edge" not in x
         if "ontoRunNER" not in x
     ]
+    # Ancestor indices, built once per ontology for all output files.
+    ancestor_indexes = {}
     for output_file in output_file_list:
-        output_df = pd.read_csv(output_file, sep="\t", low_memory=False)
+        output_df = read_results(output_file)
         output_df.columns = output_df.columns.str.replace(" ", "_").str.lower()
         # Consolidate rows where the entitys is the same
         # and recognized from multiple origins
-        output_df = output_df.rename(
-            columns={"entity_id": "object_id", "type": "object_category"}
+        output_df = apply_result_dtypes(
+            output_df.rename(
+                columns={"entity_id": "object_id", "type": "object_category"}
+            )
         )
 
-        output_df = consolidate_rows(output_df)
+        with stage("consolidate", rows=len(output_df)):
+            output_df = consolidate_rows(output_df)
 
+        # 'synonym[SYNONYM_OF:label]' -> 'synonym', 'label'
         output_df[["preferred_form", "object_label"]] = output_df[
             "preferred_form"
-        ].str.split("\\[SYNONYM_OF:", expand=True)
-
-        output_df["object_label"] = output_df["object_label"].str.replace(
-            "]", "", regex=True
-        )
+        ].str.extract(r"^(.*?)(?:\[SYNONYM_OF:(.*?)\]*)?$")
         output_df["object_label"] = output_df["object_label"].fillna(
             output_df["preferred_form"]
         )
 
-        output_df["pos_and_ne_chunk"] = (
-            output_df["matched_term"]
-            .apply(word_tokenize)
-            .apply(pos_tag)
-            .apply(ne_chunk)
-        )
-
-        output_df = get_column_doc_ratio(output_df, "object_label")
-        output_df = get_column_doc_ratio(output_df, "matched_term")
-
-        # Add column which indicates how close
-        # of a match is the recognized entity.
-        output_df.insert(
-            6,
-            "match_type",
-            output_df.apply(
-                lambda x: get_match_type(
-                    x.matched_term.lower(), x.preferred_form.lower()
-                ),
-                axis=1,
-            ),
-        )
-
-        # Levenshtein distances
-        output_df.insert(
-            7,
-            "levenshtein_distance",
-            output_df.apply(
-                lambda x: textdistance.levenshtein.distance(
-                    x.matched_term.lower(), x.preferred_form.lower()
-                ),
-                axis=1,
-            ),
-        )
-
-        # Jaccard Index
-
-        output_df.insert(
-            8,
-            "jaccard_index",
-            output_df.apply(
-                lambda x: textdistance.jaccard.distance(
-                    x.matched_term.lower(), x.preferred_form.lower()
-                ),
-                axis=1,
-            ),
-        )
+        # The ratios lowercase the terms, which are tagged as matched.
+        matched_terms = output_df["matched_term"]
+        with stage("doc_ratio", rows=len(output_df)):
+            output_df = get_doc_ratios(output_df, ["object_label", "matched_term"])
+
+        # Tagged after the ratios, so that their deduplication can hash
+        # rows rather than compare the str of every (nltk Tree) value.
+        with stage("pos_and_ne_chunk", rows=len(output_df)):
+            output_df["pos_and_ne_chunk"] = (
+                matched_terms.loc[output_df.index]
+                .apply(word_tokenize)
+                .apply(pos_tag)
+                .apply(ne_chunk)
+            )
 
-        # Monge-Elkan
-        output_df.insert(
-            9,
-            "monge_elkan",
-            output_df.apply(
-                lambda x: textdistance.monge_elkan.distance(
-                    x.matched_term.lower(), x.preferred_form.lower()
-                ),
-                axis=1,
-            ),
-        )
+        # Add columns which indicate how close
+        # of a match is the recognized entity:
+        # match type, Levenshtein distance, Jaccard index and Monge-Elkan.
+        with stage("similarity", rows=len(output_df)):
+            similarity_df = get_similarity_features(output_df)
+        for i, column in enumerate(SIMILARITY_COLUMNS):
+            output_df.insert(6 + i, column, similarity_df[column])
 
         output_df["sentence"] = ""
 
@@ -350,39 +405,50 @@ def parse(
                 "object_sentence_%",
             ]
         )
+        output_df = apply_result_dtypes(output_df)
         # TODO: Maybe use OAK for getting ancestors (?)
         if need_ancestors:
-            output_df = get_ancestors(output_df, nodes_and_edges)
-
-        final_output_file = output_file.replace(".tsv", "_ontoRunNER.tsv")
+            with stage("ancestors", rows=len(output_df)):
+                output_df = get_ancestors(
+                    output_df, nodes_and_edges, serial_dir, ancestor_indexes
+                )
 
-        pd.DataFrame(output_df.columns).T.to_csv(
-            final_output_file, sep="\t", index=None, header=None
+        final_output_file = (
+            os.path.splitext(output_file)[0]
+            + "_ontoRunNER"
+            + OUTPUT_FORMATS[output_format]
         )
 
-        if len(input_list_tsv) > 0:
-            for f in input_list_tsv:
-                input_df = pd.read_csv(f, sep="\t", low_memory=False, index_col=None)
-                sentencify(input_df, output_df, final_output_file)
-
-        if len(input_list_txt) > 0:
-            # Read each text file such that Id = filename and text = full text
-            for f in input_list_txt:
-                input_df = pd.DataFrame(columns=["id", "text"])
-                sniffer = csv.Sniffer()
-                sample_bytes = 128
-                dialect = sniffer.sniff(open(f).readline(sample_bytes))
-                if dialect.delimiter == "\t" or dialect.delimiter == ",":
+        with ResultWriter(final_output_file, output_format) as writer:
+            # The columns are written even if no sentence is.
+            writer.write(output_df.iloc[:0])
+            if len(input_list_tsv) > 0:
+                for f in input_list_tsv:
                     input_df = pd.read_csv(
-                        f, sep=dialect.delimiter, low_memory=False, index_col=None
-                    )
-                else:
-                    id = f.split("/")[-1].split(".txt")[0]
-                    with open(f, "r") as fn:
-                        text = fn.readlines()
-                        text = "".join(text).replace("\n", " ")
-                    input_df = input_df.append(
-                        {"id": id, "text": text}, ignore_index=True
+                        f, sep="\t", low_memory=False, index_col=None
                     )
+                    with stage("sentencify", documents=len(input_df)):
+                        sentencify(input_df, output_df, writer, workers)
+
+            if len(input_list_txt) > 0:
+                # Read each text file such that Id = filename and text = full text
+                for f in input_list_txt:
+                    input_df = pd.DataFrame(columns=["id", "text"])
+                    sniffer = csv.Sniffer()
+                    sample_bytes = 128
+                    dialect = sniffer.sniff(open(f).readline(sample_bytes))
+                    if dialect.delimiter == "\t" or dialect.delimiter == ",":
+                        input_df = pd.read_csv(
+                            f, sep=dialect.delimiter, low_memory=False, index_col=None
+                        )
+                    else:
+                        id = f.split("/")[-1].split(".txt")[0]
+                        with open(f, "r") as fn:
+                            text = fn.readlines()
+                            text = "".join(text).replace("\n", " ")
+                        input_df = input_df.append(
+                            {"id": id, "text": text}, ignore_index=True
+                        )
 
-                sentencify(input_df, output_df, final_output_file)
+                    with stage("sentencify", documents=len(input_df)):
+                        sentencify(input_df, output_df, writer, workers)
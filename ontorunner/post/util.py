@@ -1,11 +1,57 @@
 """Utility functions called after NER."""
+import hashlib
+import json
+import logging
 import os
-from typing import List
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 
-from . import NODE_AND_EDGE_DIR, SUBCLASS_PREDICATE
+from ontorunner import FINGERPRINT_FILENAME
+from ontorunner.result_io import read_results
+from ontorunner.utils import get_file_fingerprint, is_fingerprint_current
+
+from . import (ANCESTOR_CACHE_DIR_NAME, NLTK_RESOURCES, NODE_AND_EDGE_DIR,
+               RESULT_DTYPES, SUBCLASS_PREDICATE)
+
+ANCESTOR_INDEX_ARRAYS = [
+    "parent_offsets",
+    "parent_indices",
+    "closure_offsets",
+    "closure_indices",
+]
+# NLTK resources already found during this run.
+_NLTK_RESOURCES_FOUND = set()
+
+
+def ensure_nltk_resources(
+    resources: Optional[List[str]] = None, download: bool = True
+) -> List[str]:
+    """
+    Make sure NLTK resources are available locally.
+
+    Resources are looked up in the local NLTK data path first and only
+    downloaded when missing, so that offline runs work once provisioned.
+
+    :param resources: Resource ids (keys of NLTK_RESOURCES), all by default.
+    :param download: Download missing resources.
+    :return: Resource ids that are still missing.
+    """
+    import nltk
+
+    missing = []
+    for name in resources or NLTK_RESOURCES:
+        if name in _NLTK_RESOURCES_FOUND:
+            continue
+        try:
+            nltk.data.find(NLTK_RESOURCES[name])
+        except LookupError:
+            if not (download and nltk.download(name, quiet=True)):
+                missing.append(name)
+                continue
+        _NLTK_RESOURCES_FOUND.add(name)
+    return missing
 
 
 def filter_synonyms(df: pd.DataFrame) -> pd.DataFrame:
@@ -27,12 +73,63 @@ def filter_synonyms(df: pd.DataFrame) -> pd.DataFrame:
     return new_df
 
 
+def apply_result_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast the NER result columns of a DataFrame to RESULT_DTYPES.
+
+    Integer columns with missing values are left as they are.
+
+    :param df: Pandas DataFrame.
+    :return: Pandas DataFrame with compact dtypes.
+    """
+    dtypes = {
+        column: dtype
+        for column, dtype in RESULT_DTYPES.items()
+        if column in df.columns
+        and not (dtype.startswith("int") and df[column].isna().any())
+    }
+    return df.astype(dtypes)
+
+
+def fill_missing(series: pd.Series, value: str) -> pd.Series:
+    """Fill missing values, also of categorical Series.
+
+    :param series: Pandas Series.
+    :param value: Fill value, added to the categories if needed.
+    :return: Pandas Series.
+    """
+    if series.dtype == "category" and value not in series.cat.categories:
+        series = series.cat.add_categories(value)
+    return series.fillna(value)
+
+
+def get_row_keys(df: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """Number the distinct combinations of values of columns.
+
+    Each column is dictionary encoded once and the codes are combined
+    column by column, so the keys stay below the number of rows.
+    Missing values are a value of their own.
+
+    :param df: Pandas DataFrame.
+    :param columns: Key columns.
+    :return: Key of each row, numbered in order of first appearance.
+    """
+    keys = np.zeros(len(df), dtype=np.int64)
+    for column in columns:
+        codes, uniques = pd.factorize(df[column])
+        # Missing values are coded -1.
+        keys = keys * (len(uniques) + 1) + codes + 1
+        keys, _ = pd.factorize(keys)
+    return keys
+
+
 def consolidate_rows(df: pd.DataFrame) -> pd.DataFrame:
     """
     Group rows by all columns except "origin".
 
     This is done to remove redundancies
-    created by entity recognition from multiple sources/ontologies
+    created by entity recognition from multiple sources/ontologies.
+    Rows are kept in order of first appearance and the origins of
+    duplicate rows are joined with " | ".
 
     :param df: Input DataFrame
     :type df: pd.DataFrame
@@ -40,20 +137,100 @@ def consolidate_rows(df: pd.DataFrame) -> pd.DataFrame:
     :rtype: pd.DataFrame
     """
     # drops columns where all rows are None
-    df.dropna(axis=1, how="all", inplace=True)
+    df = df.dropna(axis=1, how="all")
     grouping_columns = df.columns.tolist()
     grouping_columns.remove("origin")
 
-    new_df = (
-        df.fillna("tmp")
-        .groupby(grouping_columns)
-        .agg({"origin": lambda o: " | ".join(o)})
-        .reset_index()
-        .replace({"object_match_field": {"tmp": ""}})
-    )
+    keys = get_row_keys(df, grouping_columns)
+    origin = df["origin"].astype(object).fillna("").astype(str).to_numpy(dtype=object)
+    first_rows = np.unique(keys, return_index=True)[1]
+    # Join the origins of each key one position within the key at a time.
+    positions = pd.Series(keys).groupby(keys).cumcount().to_numpy()
+    joined_origin = origin[first_rows]
+    for position in range(1, positions.max() + 1 if len(keys) else 0):
+        rows = positions == position
+        joined_origin[keys[rows]] += " | " + origin[rows]
+
+    new_df = df.iloc[first_rows][grouping_columns].reset_index(drop=True)
+    new_df["origin"] = joined_origin
+    if "object_match_field" in new_df.columns:
+        new_df["object_match_field"] = fill_missing(new_df["object_match_field"], "")
     return new_df
 
 
+def drop_duplicate_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Drop duplicate rows.
+
+    Values are compared as they are, or as str if any is unhashable
+    (e.g. the nltk Trees of 'pos_and_ne_chunk').
+
+    :param df: Pandas DataFrame
+    :return: Pandas DataFrame without duplicate rows.
+    """
+    try:
+        is_duplicate = df.duplicated()
+    except TypeError:
+        is_duplicate = df.astype(str).duplicated()
+    return df.loc[~is_duplicate.to_numpy()]
+
+
+def get_doc_counts(df: pd.DataFrame, columns: List[str]) -> Dict[str, pd.Series]:
+    """Get the number of documents each str of columns appears in.
+
+    :param df: Pandas DataFrame
+    :param columns: Column names of the terms
+    :return: Pandas Series of document counts indexed by the lowercased
+            str, per column.
+    """
+    doc_codes, doc_ids = pd.factorize(df["document_id"])
+    n_docs = max(len(doc_ids), 1)
+    doc_counts = {}
+    for column in columns:
+        codes, uniques = pd.factorize(df[column].str.lower())
+        # Distinct (str, document) pairs, missing strs excluded.
+        found = codes >= 0
+        pairs = np.unique(codes[found].astype(np.int64) * n_docs + doc_codes[found])
+        doc_counts[column] = pd.Series(
+            np.bincount(pairs // n_docs, minlength=len(uniques)),
+            index=pd.Index(uniques, name=column),
+        )
+    return doc_counts
+
+
+def add_doc_ratios(
+    df: pd.DataFrame, doc_counts: Dict[str, pd.Series], total_docs: int
+) -> pd.DataFrame:
+    """Add str to document ratio columns from precomputed document counts.
+
+    :param df: Pandas DataFrame
+    :param doc_counts: Document counts per column, as returned by
+            get_doc_counts.
+    :param total_docs: Total number of documents.
+    :return: Pandas DataFrame with additional
+            columns showing term:document ratio
+    """
+    for column, counts in doc_counts.items():
+        df[column] = df[column].str.lower()
+        doc_count = df[column].map(counts.astype(int))
+        df[column + "_doc_count"] = doc_count
+        # This new column calculates the ratio:
+        # (# of documents where the str in 'column' appears) / (Total # of docs)
+        df[column + "_doc_ratio"] = doc_count / total_docs
+    return drop_duplicate_rows(df)
+
+
+def get_doc_ratios(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """Get str to document ratios of given columns in a pandas DataFrame.
+
+    :param df: Pandas DataFrame
+    :param columns: Column names of the terms
+    :return: Pandas DataFrame with additional
+            columns showing term:document ratio
+    """
+    total_docs = len(df["document_id"].drop_duplicates())
+    return add_doc_ratios(df, get_doc_counts(df, columns), total_docs)
+
+
 def get_column_doc_ratio(df: pd.DataFrame, column: str) -> pd.DataFrame:
     """Get str to document ratio of given column in a pandas DataFrame.
 
@@ -62,78 +239,341 @@ def get_column_doc_ratio(df: pd.DataFrame, column: str) -> pd.DataFrame:
     :return: Pandas DataFrame with additional
             columns showing term:document ratio
     """
-    df[column] = df[column].str.lower()
-    doc_label_df = df[["document_id", column]].drop_duplicates()
+    return get_doc_ratios(df, [column])
 
-    total_docs = len(df["document_id"].drop_duplicates())
 
-    doc_count = column + "_doc_count"
+class AncestorIndex(object):
+    """Subclass hierarchy of an ontology with its transitive closure.
 
-    doc_count_df = (
-        doc_label_df.groupby(column)
-        .size()
-        .sort_values(ascending=False)
-        .reset_index(name=doc_count)
-    )
-    # This new column calculates the ratio:
-    # (# of documents where the str in 'column' appears) / (Total # of docs)
-    new_column = column + "_doc_ratio"
+    Both the parent adjacency and the closure are stored in CSR form:
+    the parents (or ancestors) of node ``i`` are
+    ``indices[offsets[i]:offsets[i + 1]]``, where ids point into ``nodes``.
+    """
 
-    doc_count_df[new_column] = doc_count_df[doc_count] / total_docs
+    def __init__(
+        self,
+        nodes: List[str],
+        parent_offsets: np.ndarray,
+        parent_indices: np.ndarray,
+        closure_offsets: np.ndarray,
+        closure_indices: np.ndarray,
+    ):
+        self.nodes = nodes
+        self.parent_offsets = parent_offsets
+        self.parent_indices = parent_indices
+        self.closure_offsets = closure_offsets
+        self.closure_indices = closure_indices
+        self.node_ids: Dict[str, int] = {n: i for i, n in enumerate(nodes)}
 
-    df = df.merge(doc_count_df, how="left", on=column)
-    df = df.loc[df.astype(str).drop_duplicates().index]
-    return df
+    @classmethod
+    def from_edges_df(cls, edges_df: pd.DataFrame) -> "AncestorIndex":
+        """Build the index from KGX edges.
 
+        :param edges_df: KGX edges of source ontology in DataFrame form
+            (already filtered to subclass edges).
+        :return: AncestorIndex object.
+        """
+        edges_df = edges_df.drop_duplicates(["subject", "object"])
+        codes, nodes = pd.factorize(
+            pd.concat([edges_df["subject"], edges_df["object"]], ignore_index=True)
+        )
+        subjects = codes[: len(edges_df)]
+        objects = codes[len(edges_df) :]
+        # Stable sort keeps parents in the order they appear in the edges file.
+        order = np.argsort(subjects, kind="stable")
+        parent_indices = objects[order].astype(np.int32)
+        parent_offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(subjects, minlength=len(nodes)), out=parent_offsets[1:])
+        closure_offsets, closure_indices = _build_closure(
+            parent_offsets, parent_indices
+        )
+        return cls(
+            nodes.tolist(),
+            parent_offsets,
+            parent_indices,
+            closure_offsets,
+            closure_indices,
+        )
 
-def ancestor_generator(df: pd.DataFrame, obj_series: pd.DataFrame) -> List[str]:
-    """
-    Return an ancestor list of a CURIE.
+    @classmethod
+    def from_edges_file(
+        cls, edges_file: str, serial_dir: Optional[str] = None
+    ) -> "AncestorIndex":
+        """Build an index from a KGX '*_edges.tsv' file.
+
+        If `serial_dir` is given, the index is cached there, under a
+        directory named after the absolute path of the edges file, and
+        reused until the edges file changes.
 
-    :param df: KGX edges of source ontology in DataFrame form.
-    :return: List of CURIES (ancestors)
+        :param edges_file: Path to the KGX edges file.
+        :param serial_dir: Directory for serialized files.
+        :return: AncestorIndex object.
+        """
+        cache_dir = None
+        if serial_dir:
+            # Edges files of the same name in different directories do
+            # not share a cache.
+            path_hash = hashlib.sha256(
+                os.path.abspath(edges_file).encode("utf8")
+            ).hexdigest()[:16]
+            cache_dir = os.path.join(
+                serial_dir,
+                ANCESTOR_CACHE_DIR_NAME,
+                os.path.splitext(os.path.basename(edges_file))[0] + "_" + path_hash,
+            )
+            fingerprint_file = os.path.join(cache_dir, FINGERPRINT_FILENAME)
+            if os.path.isfile(fingerprint_file):
+                with open(fingerprint_file, "r") as ff:
+                    fingerprint = json.load(ff)
+                if is_fingerprint_current(edges_file, fingerprint):
+                    if os.stat(edges_file).st_mtime_ns != fingerprint["mtime"]:
+                        # Touched but unchanged: skip hashing next time.
+                        with open(fingerprint_file, "w") as ff:
+                            json.dump(get_file_fingerprint(edges_file), ff)
+                    return cls.load(cache_dir)
+
+        edges_df = pd.read_csv(
+            edges_file,
+            sep="\t",
+            usecols=["subject", "predicate", "object"],
+            low_memory=False,
+        )
+        edges_df = edges_df.loc[edges_df["predicate"] == SUBCLASS_PREDICATE]
+        ancestor_index = cls.from_edges_df(edges_df)
+        if cache_dir:
+            ancestor_index.save(cache_dir, get_file_fingerprint(edges_file))
+        return ancestor_index
+
+    @classmethod
+    def load(cls, cache_dir: str) -> "AncestorIndex":
+        """Load a serialized index, memory-mapping its arrays.
+
+        :param cache_dir: Directory the index was saved to.
+        :return: AncestorIndex object.
+        """
+        with open(os.path.join(cache_dir, "nodes.txt"), "r") as nf:
+            nodes = nf.read().splitlines()
+        arrays = [
+            np.load(os.path.join(cache_dir, name + ".npy"), mmap_mode="r")
+            for name in ANCESTOR_INDEX_ARRAYS
+        ]
+        return cls(nodes, *arrays)
+
+    def save(self, cache_dir: str, fingerprint: dict) -> None:
+        """Serialize the index.
+
+        The fingerprint is written last so an interrupted save is rebuilt.
+
+        :param cache_dir: Destination directory.
+        :param fingerprint: Fingerprint of the source edges file.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        fingerprint_file = os.path.join(cache_dir, FINGERPRINT_FILENAME)
+        if os.path.isfile(fingerprint_file):
+            os.remove(fingerprint_file)
+        with open(os.path.join(cache_dir, "nodes.txt"), "w") as nf:
+            nf.write("\n".join(self.nodes))
+        for name in ANCESTOR_INDEX_ARRAYS:
+            np.save(os.path.join(cache_dir, name + ".npy"), getattr(self, name))
+        with open(fingerprint_file, "w") as ff:
+            json.dump(fingerprint, ff)
+
+    def ancestors(self, curie: str) -> List[str]:
+        """Return all ancestors of a CURIE, nearest first.
+
+        Direct parents come first, followed by their own ancestors,
+        without duplicates.
+
+        :param curie: CURIE of the term.
+        :return: List of CURIES (ancestors)
+        """
+        node_id = self.node_ids.get(curie)
+        if node_id is None:
+            return []
+        start, end = self.closure_offsets[node_id], self.closure_offsets[node_id + 1]
+        return [self.nodes[i] for i in self.closure_indices[start:end]]
+
+
+def _build_closure(
+    parent_offsets: np.ndarray, parent_indices: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the transitive closure of a parent adjacency in CSR form.
+
+    Strongly connected components (subclass cycles) are collapsed with
+    Tarjan's algorithm, which completes a component only after all the
+    components it reaches. The closure of each component is then built
+    from finished parent closures, so every node of a cycle gets the
+    same ancestors (the other nodes of the cycle and their ancestors).
+    Closures are written to a flat int32 buffer, and a node shares the
+    closure of its component, without itself.
+
+    :param parent_offsets: CSR offsets of the parent adjacency.
+    :param parent_indices: CSR indices of the parent adjacency.
+    :return: CSR offsets and indices of the closure.
     """
-    ancestor_list = []
-    obj_series_df = df.loc[df["subject"] == obj_series.object_id]
-    while not df.loc[df["subject"] == obj_series.object_id].empty:
-        obj_series_df = df.loc[df["subject"] == obj_series.object_id]
-        ancestor_list.append(obj_series_df.iloc[0].object_id)
-        obj_series = obj_series_df.iloc[0]
+    n_nodes = len(parent_offsets) - 1
+    offsets = parent_offsets.tolist()
+    parents = parent_indices.tolist()
+    visit_index = [-1] * n_nodes
+    lowlink = [0] * n_nodes
+    on_stack = [False] * n_nodes
+    node_component = [-1] * n_nodes
+    component_stack: List[int] = []
+    n_visited = 0
 
-    return ancestor_list
+    buffer = np.zeros(max(2 * len(parents), 16), dtype=np.int32)
+    buffer_size = 0
+    component_offsets = [0]
+
+    def add_component(members: List[int]) -> None:
+        nonlocal buffer, buffer_size
+        component = len(component_offsets) - 1
+        # Direct parents first, followed by their own ancestors.
+        ancestor_list = [
+            p
+            for member in members
+            for p in parents[offsets[member] : offsets[member + 1]]
+        ]
+        for parent_component in dict.fromkeys(node_component[p] for p in ancestor_list):
+            if parent_component != component:
+                start, end = component_offsets[parent_component : parent_component + 2]
+                ancestor_list.extend(buffer[start:end].tolist())
+        ancestors = list(dict.fromkeys(ancestor_list))
+        if len(members) == 1:
+            # A node is not its own ancestor (self-loop).
+            ancestors = [a for a in ancestors if a != members[0]]
+        if buffer_size + len(ancestors) > len(buffer):
+            grown = np.zeros(2 * (buffer_size + len(ancestors)), dtype=np.int32)
+            grown[:buffer_size] = buffer[:buffer_size]
+            buffer = grown
+        buffer[buffer_size : buffer_size + len(ancestors)] = ancestors
+        buffer_size += len(ancestors)
+        component_offsets.append(buffer_size)
+
+    for root in range(n_nodes):
+        if visit_index[root] >= 0:
+            continue
+        visit_index[root] = lowlink[root] = n_visited
+        n_visited += 1
+        component_stack.append(root)
+        on_stack[root] = True
+        # (node, position of the next parent to visit)
+        work = [(root, offsets[root])]
+        while work:
+            node, i = work[-1]
+            if i < offsets[node + 1]:
+                work[-1] = (node, i + 1)
+                p = parents[i]
+                if visit_index[p] < 0:
+                    visit_index[p] = lowlink[p] = n_visited
+                    n_visited += 1
+                    component_stack.append(p)
+                    on_stack[p] = True
+                    work.append((p, offsets[p]))
+                elif on_stack[p]:
+                    lowlink[node] = min(lowlink[node], visit_index[p])
+                continue
+            work.pop()
+            if work:
+                child = work[-1][0]
+                lowlink[child] = min(lowlink[child], lowlink[node])
+            if lowlink[node] == visit_index[node]:
+                component = len(component_offsets) - 1
+                members = []
+                while True:
+                    member = component_stack.pop()
+                    on_stack[member] = False
+                    node_component[member] = component
+                    members.append(member)
+                    if member == node:
+                        break
+                members.sort()
+                add_component(members)
+
+    # Expand the component closures to every node, dropping the node itself.
+    component_offsets_array = np.array(component_offsets, dtype=np.int64)
+    node_component_array = np.array(node_component, dtype=np.int64)
+    starts = component_offsets_array[node_component_array]
+    lengths = component_offsets_array[node_component_array + 1] - starts
+    owners = np.repeat(np.arange(n_nodes, dtype=np.int32), lengths)
+    positions = np.arange(lengths.sum(), dtype=np.int64) - np.repeat(
+        np.cumsum(lengths) - lengths - starts, lengths
+    )
+    closure_indices = buffer[positions]
+    is_other = closure_indices != owners
+    closure_indices = closure_indices[is_other]
+    closure_offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owners[is_other], minlength=n_nodes), out=closure_offsets[1:])
+    return closure_offsets, closure_indices
 
 
 def get_ancestors(
-    df: pd.DataFrame, nodes_and_edges_dir: str = NODE_AND_EDGE_DIR
+    df: Union[pd.DataFrame, str],
+    nodes_and_edges_dir: str = NODE_AND_EDGE_DIR,
+    serial_dir: Optional[str] = None,
+    ancestor_indexes: Optional[Dict[str, "AncestorIndex"]] = None,
 ) -> pd.DataFrame:
     """
     Return a DataFrame with 'ancestors' column.
 
-    :param df: Input dataframe containing intermediate NER result.
+    :param df: Input dataframe containing intermediate NER result, or
+        its TSV, Parquet or Arrow IPC file.
     :param nodes_and_edges_dir: Dir location of KGX edges & nodes file (tsv)
+    :param serial_dir: Dir location for cached ancestor indices
+        (None, the default, disables caching).
+    :param ancestor_indexes: Ancestor indices by edges file, filled as
+        ontologies are first needed. Pass the same dict to every call of
+        a run so each index is only built (or loaded) once.
     :return: Dataframe with an 'ancestors' column.
     """
-    df["ancestors"] = ""
-    object_origin = df[["object_id", "origin"]]
-    object_origin["object_id"] = object_origin["object_id"].str.replace("_SYNONYM", "")
-    object_origin = object_origin.drop_duplicates()
-    all_origins = object_origin["origin"].drop_duplicates().tolist()
+    if isinstance(df, str):
+        df = read_results(df)
+    df = df.drop(columns=["ancestors"], errors="ignore")
+    object_origin = pd.DataFrame(
+        {
+            "object_id": df["object_id"].str.replace("_SYNONYM", "", regex=False),
+            "origin": df["origin"],
+        }
+    )
+    unique_object_origin = object_origin.drop_duplicates()
+    all_origins = unique_object_origin["origin"].drop_duplicates().tolist()
     all_origins = [ogn for ogn in all_origins if "|" not in ogn]
 
+    if ancestor_indexes is None:
+        ancestor_indexes = {}
+    list_of_ancestor_dfs = []
     for o in all_origins:
-        object_origin_subset = object_origin.loc[object_origin["origin"] == o]
+        object_ids = unique_object_origin.loc[
+            unique_object_origin["origin"] == o, "object_id"
+        ]
         ont_name = o.split(".")[0]
         ont_edge_file = os.path.join(nodes_and_edges_dir, ont_name + "_edges.tsv")
-        print(f"Getting ancestors for {ont_name} terms....")
-        ont_edge_df = pd.read_csv(ont_edge_file, sep="\t", low_memory=False)
-        ont_edge_df = ont_edge_df.loc[ont_edge_df["predicate"] == SUBCLASS_PREDICATE]
-        ont_edge_df.rename(columns={"object": "object_id"}, inplace=True)
-        for idx, obj in object_origin_subset.T.iteritems():
-            list_of_ancestors = ancestor_generator(ont_edge_df, pd.Series(obj).T)
-            df.loc[
-                (df["object_id"] == object_origin_subset["object_id"][idx])
-                & (df["origin"] == object_origin_subset["origin"][idx]),
-                "ancestors",
-            ] = str(list_of_ancestors)
+        ancestor_index = ancestor_indexes.get(ont_edge_file)
+        if ancestor_index is None:
+            logging.info(f"Getting ancestors for {ont_name} terms....")
+            ancestor_index = AncestorIndex.from_edges_file(ont_edge_file, serial_dir)
+            ancestor_indexes[ont_edge_file] = ancestor_index
+        list_of_ancestor_dfs.append(
+            pd.DataFrame(
+                {
+                    "object_id": object_ids.values,
+                    "origin": o,
+                    "ancestors": [
+                        str(ancestor_index.ancestors(x)) for x in object_ids.values
+                    ],
+                }
+            )
+        )
+
+    if list_of_ancestor_dfs:
+        ancestor_df = pd.concat(list_of_ancestor_dfs, ignore_index=True)
+        ancestors = object_origin.merge(
+            ancestor_df, how="left", on=["object_id", "origin"]
+        )["ancestors"]
+        df["ancestors"] = ancestors.fillna("").values
+    else:
+        df["ancestors"] = ""
 
+    for column in df.select_dtypes("category").columns:
+        df[column] = fill_missing(df[column], "")
     return df.replace(np.nan, "")
@@ -1,25 +1,36 @@
+import multiprocessing
 import os
 import shutil
+from timeit import default_timer as timer
+from typing import Dict, Optional, Tuple
 
 import click
 from genericpath import isdir
-from kgx.cli.cli_utils import transform
 
-from ontorunner import DATA_DIR_NAME, PARENT_DIR, SERIAL_DIR_NAME
+from ontorunner import (DATA_DIR, DATA_DIR_NAME, PARENT_DIR, SERIAL_DIR_NAME,
+                        TERMS_DIR_NAME)
 from ontorunner.converters import biohub_converter as bc
+from ontorunner.post import NODE_AND_EDGE_DIR
 
 SERIAL_DIR = os.path.join(PARENT_DIR, DATA_DIR_NAME, SERIAL_DIR_NAME)
+TERMS_DIR = os.path.join(DATA_DIR, TERMS_DIR_NAME)
 
 
-def json2tsv(input, output) -> None:
+def json2tsv(input, output, workers=1, force=False) -> None:
     """
     Converts an JSON file into 'nodes' and 'edges' TSV.
 
-    :param input: Input file (JSON file).
-    :param ouput: Output file name desired.
+    :param input: Input file (JSON file), or folder of JSON files
+        (default: 'data/input/').
+    :param ouput: Output file name desired, or output folder when
+        converting a folder (default: 'data/nodes_and_edges/').
+    :param workers: Number of files converted in parallel (folders only).
+    :param force: Convert files whose outputs are up to date (folders only).
     :return: None.
     """
-    if input:
+    if input and not isdir(input):
+        from kgx.cli.cli_utils import transform
+
         if output is None:
             output = "data/nodes_and_edges/"
 
@@ -30,41 +41,124 @@ def json2tsv(input, output) -> None:
             output_format="tsv",
         )
     else:
-        input_folder = "data/input/"
-        output_folder = "data/nodes_and_edges/"
+        json2tsv_batch(
+            input or "data/input/", output or "data/nodes_and_edges/", workers, force
+        )
+
+
+def json2tsv_batch(
+    input_dir, output_dir, workers=1, force=False
+) -> Dict[str, Optional[float]]:
+    """
+    Converts every JSON file in a folder into 'nodes' and 'edges' TSVs.
+
+    Files whose nodes and edges TSVs are both newer than the JSON file
+    are skipped, unless `force`.
+
+    :param input_dir: Folder searched (recursively) for JSON files.
+    :param output_dir: Output folder.
+    :param workers: Number of files converted in parallel.
+    :param force: Convert files whose outputs are up to date.
+    :return: Seconds taken per JSON file (None if skipped).
+    """
+    timings: Dict[str, Optional[float]] = {}
+    tasks = []
+    for subdir, dirs, files in os.walk(input_dir):
+        for file in sorted(files):
+            fn, ext = os.path.splitext(file)
+            if ext != ".json":
+                continue
+
+            input_file = os.path.join(subdir, file)
+            output = os.path.join(output_dir, fn)
+            if not force and _is_json2tsv_current(input_file, output):
+                print(f"{input_file}: up to date, skipped.")
+                timings[input_file] = None
+            else:
+                tasks.append((input_file, output))
+
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(min(workers, len(tasks))) as pool:
+            for input_file, seconds in pool.imap_unordered(_json2tsv_file, tasks):
+                print(f"{input_file}: converted in {seconds:.1f} seconds.")
+                timings[input_file] = seconds
+    else:
+        for input_file, seconds in map(_json2tsv_file, tasks):
+            print(f"{input_file}: converted in {seconds:.1f} seconds.")
+            timings[input_file] = seconds
+
+    return timings
+
+
+def _json2tsv_file(task: Tuple[str, str]) -> Tuple[str, float]:
+    from kgx.cli.cli_utils import transform
+
+    input_file, output = task
+    start = timer()
+    transform(
+        inputs=[input_file],
+        input_format="obojson",
+        output=output,
+        output_format="tsv",
+    )
+    return input_file, timer() - start
 
-        for subdir, dirs, files in os.walk(input_folder):
-            for file in files:
-                fn, ext = os.path.splitext(file)
 
-                if ext == ".json":
-                    transform(
-                        inputs=[subdir + file],
-                        input_format="obojson",
-                        output=output_folder + fn,
-                        output_format="tsv",
-                    )
+def _is_json2tsv_current(input_file: str, output: str) -> bool:
+    # KGX writes '<output>_nodes.tsv' and '<output>_edges.tsv'.
+    source_mtime = os.stat(input_file).st_mtime_ns
+    return all(
+        os.path.isfile(output + suffix)
+        and os.stat(output + suffix).st_mtime_ns > source_mtime
+        for suffix in ["_nodes.tsv", "_edges.tsv"]
+    )
 
 
-def prepare_termlist(input, output) -> None:
+def prepare_termlist(input, output, workers=1) -> None:
     """
     Generates a Bio Term Hub formatted term list for use with OGER.
 
     :param input: Input file 'ontology_nodes.tsv'.
     :param ouput: TSV file of list of terms 'ontology_termlist.tsv'.
+    :param workers: Number of worker processes.
     :return: None.
     """
-    bc.parse(input, output)
+    skipped = bc.parse(input, output, workers)
+    if any(skipped.values()):
+        print(f"Skipped lines: {skipped}")
+
+
+def prepare_termlists(
+    input=NODE_AND_EDGE_DIR, output=TERMS_DIR, workers=1, force=False
+) -> None:
+    """
+    Generates termlists for every 'ontology_nodes.tsv' in a directory.
+
+    Only termlists whose nodes file changed since the last run are
+    regenerated (see biohub_converter.parse_directory).
+
+    :param input: Directory of 'ontology_nodes.tsv' files.
+    :param output: Directory of 'ontology_termlist.tsv' files.
+    :param workers: Number of worker processes.
+    :param force: Regenerate every termlist.
+    :return: None.
+    """
+    regenerated = bc.parse_directory(input, output, workers, force)
+    print(f"{len(regenerated)} termlist(s) regenerated.")
 
 
 @click.group()
 def cli():
     """
     Utility functions:
-     * delete-cache: Delete all serialized files in the 'serialized' folder.
-     * json2tsv: Convert ontology.json to ontology_nodes.tsv and ontology_edges.tsv.
+     * delete-cache: Delete all serialized files in the 'serialized' folder
+     (including cached ancestor indices).
+     * json2tsv: Convert ontology.json (or a folder of them) to
+     ontology_nodes.tsv and ontology_edges.tsv.
      * prepare-termlist: Convert ontology_nodes.tsv into ontology_termlist.tsv which is
      consumed by the ontoRunNER package.
+     * prepare-termlists: Run prepare-termlist on every changed nodes file in a folder.
+     * download-nltk-data: Download the NLTK resources used in post-processing.
     """
     pass
 
@@ -72,19 +166,32 @@ def cli():
 @cli.command("json2tsv")
 @click.option("--input", "-i", type=click.Path(exists=True))
 @click.option("--output", "-o", type=str)
-def json2tsv_click(input, output):
-    json2tsv(input, output)
+@click.option("--workers", "-w", default=1)
+@click.option("--force", "-f", is_flag=True, help="Convert up-to-date files too.")
+def json2tsv_click(input, output, workers, force):
+    json2tsv(input, output, workers, force)
 
 
 @cli.command("prepare-termlist")
 @click.option("--input", "-i", type=click.Path(exists=True), required=True)
 @click.option("--output", "-o", type=str, required=True)
-def prepare_termlist_click(input, output):
-    prepare_termlist(input, output)
+@click.option("--workers", "-w", default=1)
+def prepare_termlist_click(input, output, workers):
+    prepare_termlist(input, output, workers)
+
+
+@cli.command("prepare-termlists")
+@click.option("--input", "-i", type=click.Path(exists=True), default=NODE_AND_EDGE_DIR)
+@click.option("--output", "-o", type=str, default=TERMS_DIR)
+@click.option("--workers", "-w", default=1)
+@click.option("--force", "-f", is_flag=True, help="Regenerate every termlist.")
+def prepare_termlists_click(input, output, workers, force):
+    prepare_termlists(input, output, workers, force)
 
 
 @cli.command("delete-cache")
 def delete_cache():
+    """Delete all serialized files, including cached ancestor indices."""
     for f in os.listdir(SERIAL_DIR):
         path = os.path.join(SERIAL_DIR, f)
         if isdir(path):
@@ -94,5 +201,24 @@ def delete_cache():
     print("Serialzed data folder purged!")
 
 
+@cli.command("download-nltk-data")
+@click.option(
+    "--download/--no-download",
+    default=True,
+    help="Download missing resources, or only check they are available.",
+)
+def download_nltk_data(download):
+    """Download the NLTK resources used in post-processing, if missing."""
+    from ontorunner.post.util import ensure_nltk_resources
+
+    missing = ensure_nltk_resources(download=download)
+    if missing:
+        raise click.ClickException(
+            f"Could not {'download' if download else 'find'} NLTK resources: "
+            f"{', '.join(missing)}"
+        )
+    print("NLTK resources are available!")
+
+
 if __name__ == "__main__":
     cli()
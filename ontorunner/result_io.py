@@ -0,0 +1,192 @@
+"""Read and write NER results as TSV, Parquet or Arrow IPC."""
+import os
+from typing import Iterator, Optional
+
+import pandas as pd
+
+from ontorunner import OUTPUT_FORMATS
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "Parquet and Arrow output need pyarrow: pip install 'ontorunner[arrow]'"
+        ) from e
+    return pyarrow
+
+
+def get_output_format(path: str) -> str:
+    """Get the output format of a file from its extension.
+
+    :param path: File path.
+    :return: Key of OUTPUT_FORMATS ('tsv' unless Parquet or Arrow).
+    """
+    extension = os.path.splitext(path)[1]
+    for output_format, format_extension in OUTPUT_FORMATS.items():
+        if extension == format_extension:
+            return output_format
+    return "tsv"
+
+
+def _to_arrow_table(df: pd.DataFrame):
+    pa = _import_pyarrow()
+    df = df.copy()
+    for column in df.select_dtypes("object").columns:
+        # Nested values (e.g. lists of ancestors or nltk Trees) are
+        # written the way to_csv writes them.
+        if pd.api.types.infer_dtype(df[column], skipna=True) not in ("string", "empty"):
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _get_chunk_schema(table):
+    # Categories of every chunk get the same index type, and columns
+    # without any value in the first chunk are str.
+    pa = _import_pyarrow()
+    fields = []
+    for field in table.schema:
+        if pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+        elif pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        fields.append(field)
+    return pa.schema(fields, metadata=table.schema.metadata)
+
+
+class ResultWriter(object):
+    """Write a DataFrame to a file chunk by chunk.
+
+    TSV chunks are appended through one file handle (with the header
+    written once), Parquet chunks are row groups and Arrow IPC chunks
+    record batches of a single file. All chunks need the columns of the
+    first, and are cast to its types.
+    """
+
+    def __init__(
+        self, path: str, output_format: Optional[str] = None, append: bool = False
+    ):
+        """
+        :param path: Output file path.
+        :param output_format: Key of OUTPUT_FORMATS (by default from the
+            extension of `path`).
+        :param append: Append to an existing TSV file (without header).
+        """
+        self.path = path
+        self.output_format = output_format or get_output_format(path)
+        if self.output_format not in OUTPUT_FORMATS:
+            raise ValueError(
+                f"Output format '{self.output_format}' is invalid. "
+                f"Choose one of the following: {list(OUTPUT_FORMATS)}"
+            )
+        if append and self.output_format != "tsv":
+            raise ValueError("Only TSV files can be appended to.")
+        if self.output_format != "tsv":
+            _import_pyarrow()
+        self.append = append
+        self.written = append
+        self._handle = None
+        self._writer = None
+        self._schema = None
+        self._empty_df: Optional[pd.DataFrame] = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        """Write a chunk.
+
+        An empty chunk is only written if no other is, so that the file
+        has the columns.
+
+        :param df: Pandas DataFrame.
+        """
+        if df.empty:
+            if self._empty_df is None:
+                self._empty_df = df
+            return
+        self._write(df)
+
+    def _write(self, df: pd.DataFrame) -> None:
+        if self.output_format == "tsv":
+            if self._handle is None:
+                self._handle = open(self.path, "a" if self.append else "w", newline="")
+            df.to_csv(self._handle, sep="\t", index=None, header=not self.written)
+        else:
+            table = _to_arrow_table(df)
+            if self._writer is None:
+                pa = _import_pyarrow()
+                self._schema = _get_chunk_schema(table)
+                if self.output_format == "parquet":
+                    self._writer = pa.parquet.ParquetWriter(self.path, self._schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.path, self._schema)
+            self._writer.write_table(table.cast(self._schema))
+        self.written = True
+
+    def close(self) -> None:
+        """Close the file, writing the columns if no chunk was written."""
+        if not self.written:
+            self._write(
+                self._empty_df if self._empty_df is not None else pd.DataFrame()
+            )
+        if self._handle is not None:
+            self._handle.close()
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def iter_results(
+    path: str, chunk_size: Optional[int] = None, **read_csv_kwargs
+) -> Iterator[pd.DataFrame]:
+    """Iterate over the chunks of a results file.
+
+    :param path: TSV, Parquet or Arrow IPC file path.
+    :param chunk_size: Number of rows per chunk of a TSV file (None reads
+        the whole file); Parquet row groups and Arrow record batches are
+        read as written.
+    :param read_csv_kwargs: Arguments of pandas.read_csv for TSV files.
+    :return: Iterator of pandas DataFrames.
+    """
+    output_format = get_output_format(path)
+    if output_format == "tsv":
+        if chunk_size is None:
+            yield pd.read_csv(path, sep="\t", low_memory=False, **read_csv_kwargs)
+        else:
+            yield from pd.read_csv(
+                path, sep="\t", chunksize=chunk_size, **read_csv_kwargs
+            )
+    elif output_format == "parquet":
+        pa = _import_pyarrow()
+        parquet_file = pa.parquet.ParquetFile(path)
+        for i in range(parquet_file.num_row_groups):
+            yield parquet_file.read_row_group(i).to_pandas()
+    else:
+        pa = _import_pyarrow()
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i).to_pandas()
+
+
+def read_results(path: str, **read_csv_kwargs) -> pd.DataFrame:
+    """Read a results file.
+
+    :param path: TSV, Parquet or Arrow IPC file path.
+    :param read_csv_kwargs: Arguments of pandas.read_csv for TSV files.
+    :return: Pandas DataFrame.
+    """
+    output_format = get_output_format(path)
+    if output_format == "tsv":
+        return pd.read_csv(path, sep="\t", low_memory=False, **read_csv_kwargs)
+    pa = _import_pyarrow()
+    if output_format == "parquet":
+        return pa.parquet.read_table(path).to_pandas()
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_pandas()
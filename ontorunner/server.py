@@ -0,0 +1,355 @@
+"""Long-lived NER service keeping the models in memory."""
+import configparser
+import csv
+import io
+import json
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from timeit import default_timer as timer
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_MAX_BATCH_SIZE = 1000
+DEFAULT_MAX_WAIT = 0.05
+
+
+class SpacyBackend(object):
+    """Annotate documents with a warm OntoRuler."""
+
+    def __init__(self, **onto_ruler_kwargs):
+        from ontorunner.pipes.OntoRuler import OntoRuler
+
+        self.onto_ruler_obj = OntoRuler(**onto_ruler_kwargs)
+
+    def annotate(self, input_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """Annotate documents.
+
+        :param input_df: Pandas DataFrame with 'id' and 'text' columns.
+        :return: Ontology matches and sciSpacy knowledge base entities.
+        """
+        from ontorunner.spacy_module import process_documents
+
+        onto_df, kb_df = process_documents(input_df, self.onto_ruler_obj)
+        return {"annotations": onto_df, "kb_entities": kb_df}
+
+
+class OgerBackend(object):
+    """Annotate documents with a warm OGER PipelineServer."""
+
+    def __init__(self, settings: str):
+        from oger.ctrl.router import PipelineServer, Router
+
+        config = configparser.ConfigParser()
+        config.read(settings)
+        self.pipeline = PipelineServer(Router(**config._sections["Main"]))
+
+    def annotate(self, input_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """Annotate documents.
+
+        :param input_df: Pandas DataFrame with 'id' and 'text' columns.
+        :return: OGER entities.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_file = os.path.join(tmpdir, "documents.tsv")
+            # Same-length replacement keeps the entity offsets valid.
+            input_df.assign(
+                text=input_df["text"].str.replace(r"[\t\r\n]", " ", regex=True)
+            )[["id", "text"]].to_csv(
+                input_file, sep="\t", header=False, index=False, quoting=csv.QUOTE_NONE
+            )
+            doc = self.pipeline.load_one(input_file, "txt_tsv")
+            self.pipeline.process(doc)
+            output = io.StringIO()
+            self.pipeline.write(doc, "tsv", output)
+
+        output.seek(0)
+        output_df = pd.read_csv(output, sep="\t", low_memory=False)
+        output_df.columns = output_df.columns.str.replace(" ", "_").str.lower()
+        output_df["document_id"] = output_df["document_id"].astype(int)
+        return {"annotations": output_df}
+
+
+# Backend of a worker process, either inherited at fork time
+# or built by _init_worker.
+_WORKER_BACKEND = None
+
+
+def _init_worker(backend_cls: type, backend_kwargs: dict) -> None:
+    global _WORKER_BACKEND
+    if _WORKER_BACKEND is None:
+        _WORKER_BACKEND = backend_cls(**backend_kwargs)
+
+
+def _annotate_worker(input_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    return _WORKER_BACKEND.annotate(input_df)
+
+
+class _AnnotationRequest(object):
+    def __init__(self, input_df: pd.DataFrame):
+        self.input_df = input_df
+        self.result: Dict[str, pd.DataFrame] = {}
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class BatchingAnnotator(object):
+    """Batch concurrent annotation requests for a backend.
+
+    Requests arriving within `max_wait` seconds of each other are
+    annotated together, up to `max_batch_size` documents per batch.
+    With more than one worker, batches run in a pool of processes that
+    share the backend's models (copy-on-write where fork is available).
+    """
+
+    def __init__(
+        self,
+        backend,
+        backend_kwargs: Optional[dict] = None,
+        workers: int = 1,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait: float = DEFAULT_MAX_WAIT,
+    ):
+        global _WORKER_BACKEND
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests: queue.Queue = queue.Queue()
+        self.slots = threading.Semaphore(workers)
+        self.pool = None
+        if workers > 1:
+            if "fork" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("fork")
+                _WORKER_BACKEND = backend
+            else:
+                context = multiprocessing.get_context("spawn")
+            self.pool = context.Pool(
+                processes=workers,
+                initializer=_init_worker,
+                initargs=(type(backend), backend_kwargs or {}),
+            )
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def annotate(self, input_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """Annotate documents, batched with other concurrent requests.
+
+        :param input_df: Pandas DataFrame with 'id' and 'text' columns.
+        :return: Backend results, restricted to these documents.
+        """
+        request = _AnnotationRequest(input_df.reset_index(drop=True))
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def close(self) -> None:
+        """Stop batching, finish the batches in flight and shut the pool down."""
+        self.requests.put(None)
+        self.thread.join()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    def _next_batch(self) -> Optional[List[_AnnotationRequest]]:
+        request = self.requests.get()
+        if request is None:
+            return None
+        batch = [request]
+        n_docs = len(request.input_df)
+        deadline = timer() + self.max_wait
+        while n_docs < self.max_batch_size:
+            timeout = deadline - timer()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch first, then stop.
+                self.requests.put(None)
+                break
+            batch.append(request)
+            n_docs += len(request.input_df)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            # Documents are renumbered by position in the batch, so ids
+            # repeated across requests cannot get mixed up.
+            input_df = pd.concat(
+                [r.input_df[["id", "text"]] for r in batch], ignore_index=True
+            )
+            original_ids = input_df["id"].values
+            input_df["id"] = np.arange(len(input_df))
+
+            self.slots.acquire()
+            if self.pool is None:
+                try:
+                    results = self.backend.annotate(input_df)
+                except Exception as e:
+                    self._fail(batch, e)
+                else:
+                    self._finish(batch, original_ids, results)
+            else:
+                self.pool.apply_async(
+                    _annotate_worker,
+                    (input_df,),
+                    callback=lambda r, b=batch, o=original_ids: self._finish(b, o, r),
+                    error_callback=lambda e, b=batch: self._fail(b, e),
+                )
+
+    def _finish(
+        self,
+        batch: List[_AnnotationRequest],
+        original_ids: np.ndarray,
+        results: Dict[str, pd.DataFrame],
+    ) -> None:
+        try:
+            bounds = np.cumsum([len(r.input_df) for r in batch])
+            for key, df in results.items():
+                if df.empty or "document_id" not in df.columns:
+                    # Nothing to split by document: every request gets it as is.
+                    for request in batch:
+                        request.result[key] = df.copy()
+                    continue
+                positions = df["document_id"].values.astype(int)
+                df = df.assign(document_id=original_ids[positions])
+                owners = np.searchsorted(bounds, positions, side="right")
+                for i, request in enumerate(batch):
+                    request.result[key] = df[owners == i].reset_index(drop=True)
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        self.slots.release()
+        for request in batch:
+            request.done.set()
+
+    def _fail(self, batch: List[_AnnotationRequest], error: BaseException) -> None:
+        self.slots.release()
+        for request in batch:
+            request.error = error
+            request.done.set()
+
+
+def read_documents(payload) -> pd.DataFrame:
+    """Read the documents of an annotation request.
+
+    :param payload: Parsed JSON body, {"documents": [{"id": .., "text": ..}]}.
+    :return: Pandas DataFrame with 'id' and 'text' columns.
+    """
+    documents = payload.get("documents") if isinstance(payload, dict) else None
+    if not isinstance(documents, list) or not all(
+        isinstance(d, dict) and "id" in d and isinstance(d.get("text"), str)
+        for d in documents
+    ):
+        raise ValueError(
+            "Request body should be {'documents': [{'id': ..., 'text': ...}]}."
+        )
+    return pd.DataFrame(
+        {
+            "id": [d["id"] for d in documents],
+            "text": [d["text"] for d in documents],
+        }
+    )
+
+
+class AnnotationRequestHandler(BaseHTTPRequestHandler):
+    """Serve 'POST /annotate' and 'GET /health'."""
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, json.dumps({"error": "Not found."}))
+            return
+        self._send_json(200, json.dumps({"status": "ok"}))
+
+    def do_POST(self):
+        if self.path != "/annotate":
+            self._send_json(404, json.dumps({"error": "Not found."}))
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            input_df = read_documents(json.loads(self.rfile.read(length)))
+        except ValueError as e:
+            self._send_json(400, json.dumps({"error": str(e)}))
+            return
+        try:
+            results = self.server.annotator.annotate(input_df)
+        except Exception as e:
+            self._send_json(500, json.dumps({"error": repr(e)}))
+            return
+
+        body = ",".join(
+            f"{json.dumps(key)}:{df.to_json(orient='records')}"
+            for key, df in results.items()
+        )
+        self._send_json(200, "{" + body + "}")
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: str) -> None:
+        encoded = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+
+class AnnotationServer(ThreadingHTTPServer):
+    """HTTP server answering annotation requests with a BatchingAnnotator."""
+
+    daemon_threads = True
+
+    def __init__(self, address, annotator: BatchingAnnotator, quiet: bool = False):
+        super().__init__(address, AnnotationRequestHandler)
+        self.annotator = annotator
+        self.quiet = quiet
+
+
+def serve(
+    backend,
+    backend_kwargs: Optional[dict] = None,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    workers: int = 1,
+    max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+    max_wait: float = DEFAULT_MAX_WAIT,
+) -> None:
+    """Serve annotation requests until interrupted.
+
+    :param backend: SpacyBackend or OgerBackend object.
+    :param backend_kwargs: Arguments the backend was built with, used to
+        build it in worker processes where it cannot be inherited.
+    :param host: Host to listen on.
+    :param port: Port to listen on.
+    :param workers: Number of worker processes.
+    :param max_batch_size: Maximum number of documents per batch.
+    :param max_wait: Seconds a request waits for others to batch with.
+    """
+    annotator = BatchingAnnotator(
+        backend, backend_kwargs, workers, max_batch_size, max_wait
+    )
+    server = AnnotationServer((host, port), annotator)
+    print(f"Serving on http://{host}:{server.server_port}/annotate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        annotator.close()
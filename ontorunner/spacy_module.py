@@ -1,47 +1,72 @@
 """Run Spacy."""
+import multiprocessing
+import os
+import warnings
 from glob import glob
 from multiprocessing import freeze_support
 from os.path import isdir, isfile, join, splitext
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
 
-import cairosvg
 import click
 import pandas as pd
-from spacy import displacy
-from spacy.tokens import Doc, Span
 
 from ontorunner import (DATA_DIR, IMAGE_DIR, INPUT_DIR_NAME, OUTPUT_DIR,
-                        OUTPUT_DIR_NAME, SETTINGS_FILE_PATH, _get_config)
-from ontorunner.pipes.OntoRuler import OntoRuler
+                        OUTPUT_DIR_NAME, OUTPUT_FORMATS, SERIAL_DIR_NAME,
+                        SETTINGS_FILE_PATH, _get_config)
+from ontorunner.instrumentation import StageTimer, recording, stage
 from ontorunner.post import NODE_AND_EDGE_NAME, util
+from ontorunner.result_io import ResultWriter, iter_results
+from ontorunner.server import (DEFAULT_HOST, DEFAULT_MAX_BATCH_SIZE,
+                               DEFAULT_MAX_WAIT, DEFAULT_PORT)
+from ontorunner.utils import imap_bounded
+
+# spaCy, scispaCy and the OntoRuler are only loaded when a command runs,
+# so that the CLI itself starts quickly.
+if TYPE_CHECKING:
+    from spacy.tokens import Doc
+
+    from ontorunner.pipes.OntoRuler import OntoRuler
 
 SCI_SPACY_LINKERS = ["umls", "mesh", "go", "hpo", "rxnorm"]
+TOKEN_INFO_COLUMNS = [
+    "document_id",
+    "matched_term",
+    "POS",
+    "tag",
+    "scispacy_object_category",
+    "object_id",
+    "object_category",
+    "object_label",
+    "object_match_field",
+    "origin",
+    "sentence_start",
+    "sentence_end",
+    "start",
+    "end",
+]
+KB_ENTITY_COLUMNS = [
+    "document_id",
+    "cui",
+    "matched_term",
+    "aliases",
+    "definition",
+    "tui",
+]
+DEFAULT_WORKER_CHUNK_SIZE = 1000
 DEFAULT_TEXT = """A bacterial isolate, designated \
 strain SZ,was obtained from noncontaminated creek \
 sediment microcosms based on its ability to derive \
 energy from acetate oxidation coupled to tetrachloroethene."""
 
 
-def get_token_info(doc: Doc) -> pd.DataFrame:
+def get_token_info(doc: "Doc", document_id=None) -> List[dict]:
     """Get metadata associated with spans within a document.
 
     :param doc: Doc object.
-    :return: Pandas DataFrame.
-    """ """"""
-    key_list = [
-        "matched_term",
-        "POS",
-        "tag",
-        "scispacy_object_category",
-        "object_id",
-        "object_category",
-        "object_label",
-        "object_match_field",
-        "origin",
-        "sentence",
-        "start",
-        "end",
-    ]
+    :param document_id: Id of the document, included in every record.
+    :return: List of records keyed by TOKEN_INFO_COLUMNS.
+    """
 
     # # Filter df to remove certain POS'
     # """
@@ -83,141 +108,234 @@ def get_token_info(doc: Doc) -> pd.DataFrame:
         "ADV",
         "VERB",
     ]
-    onto_dict = {}
-    for k in key_list:
-        onto_dict[k] = []
-
     unwanted_labels = [
         "ORG",
         "GPE",
         "LOC",
     ]
     unwanted_span_list = []
-    valid_span = True
-    df = pd.DataFrame()
+    records = []
 
     for span in doc.ents:
         # Filter out spans with labels that are irrelevant
         if span.label_ in unwanted_labels:
             unwanted_span_list.append(span.text)
-        else:
-            if span._.is_an_ontology_term and span.text not in unwanted_span_list:
-                valid_span = any([token.pos_ not in ignore_pos for token in span])
-
-                if valid_span:
-                    pos_list = ", ".join([token.pos_ for token in span])
-                    tag_list = ", ".join([token.tag_ for token in span])
-                    onto_dict["matched_term"].append(span.text)
-                    onto_dict["POS"].append(pos_list)
-                    onto_dict["tag"].append(tag_list)
-                    onto_dict["scispacy_object_category"].append(span.label_)
-                    onto_dict["object_id"].append(span._.object_id)
-                    onto_dict["object_category"].append(span._.object_category)
-                    onto_dict["object_label"].append(span._.object_label)
-                    onto_dict["object_match_field"].append(span._.object_match_field)
-                    onto_dict["origin"].append(span._.origin)
-                    onto_dict["sentence"].append(span.sent)
-                    onto_dict["start"].append(span.start_char)
-                    onto_dict["end"].append(span.end_char)
-                df = pd.DataFrame.from_dict(onto_dict)
-                # Filter out terms that may have been
-                # missed by the 'valid_span' flag determination.
-                df = df[~df["matched_term"].isin(unwanted_span_list)]
-
-    return df
-
-
-def explode_df(df: pd.DataFrame) -> pd.DataFrame:
-    """Explode multiple DataFrames in a single row into multiple rows.
-
-    :param df: Dataframe to be exploded.
-    :return: Exploded DataFrame where each row correspond to a row in the DataFrame.
-    """
-    new_df = pd.DataFrame()
-    for _, doc_obj_row in df.iterrows():
-        tmp_df = doc_obj_row[1]
-        tmp_df.insert(0, "id", doc_obj_row.id)
-        new_df = pd.concat([new_df, tmp_df], ignore_index=True)
-
-    new_df = new_df.rename(columns={"id": "document_id"})
-    return new_df
-
-
-def onto_tokenize(doc: Doc, onto_ruler_obj: OntoRuler) -> Doc:
-    """Set custom span information from the Doc object.
+        elif span._.is_an_ontology_term and span.text not in unwanted_span_list:
+            valid_span = any([token.pos_ not in ignore_pos for token in span])
+
+            if valid_span:
+                span_record = {
+                    "document_id": document_id,
+                    "matched_term": span.text,
+                    "POS": ", ".join([token.pos_ for token in span]),
+                    "tag": ", ".join([token.tag_ for token in span]),
+                    "scispacy_object_category": span.label_,
+                    "sentence_start": span.sent.start_char,
+                    "sentence_end": span.sent.end_char,
+                    "start": span.start_char,
+                    "end": span.end_char,
+                }
+                # One record per ontology term of the matched surface form.
+                for term in span._.term_records:
+                    records.append(
+                        {
+                            **span_record,
+                            "object_id": term["object_id"],
+                            "object_category": term["object_category"],
+                            "object_label": term["object_label"],
+                            "object_match_field": term["object_match_field"],
+                            "origin": term["origin"],
+                        }
+                    )
+
+    # Filter out terms that may have been
+    # missed by the 'valid_span' flag determination.
+    return [r for r in records if r["matched_term"] not in unwanted_span_list]
+
+
+def onto_tokenize(doc: "Doc", onto_ruler_obj: "OntoRuler") -> "Doc":
+    """Return the Doc as is (deprecated).
+
+    The term information of the spans is set by the 'onto_matcher' pipe
+    of the OntoRuler pipeline while the Doc is processed, so there is
+    nothing left to set.
 
     :param doc: Doc object.
     :param onto_ruler_obj: OntoRuler object.
     :return: Doc object.
     """
-    # matches = onto_ruler_obj.match(doc)
-    matches = onto_ruler_obj.phrase_matcher(doc)
-    spans = [
-        Span(doc, start, end, label=onto_ruler_obj.label)
-        for match_id, start, end in matches
-    ]
-    # doc.spans[onto_ruler_obj.label] = spans
-
-    for _, span in enumerate(spans):
-        span._.set("has_curies", True)
-
-        if span.text.lower() in onto_ruler_obj.terms.keys():
-            span._.set(onto_ruler_obj.span_term_extension, True)
-            span._.set(
-                "object_id",
-                onto_ruler_obj.terms[span.text.lower()]["object_id"],
-            )
-            span._.set(
-                "object_category",
-                onto_ruler_obj.terms[span.text.lower()]["object_category"],
-            )
-            span._.set(
-                "object_label",
-                onto_ruler_obj.terms[span.text.lower()]["object_label"],
-            )
-            span._.set(
-                "object_match_field",
-                onto_ruler_obj.terms[span.text.lower()]["object_match_field"],
-            )
-            span._.set("origin", onto_ruler_obj.terms[span.text.lower()]["origin"])
-
+    warnings.warn(
+        "onto_tokenize is deprecated and does nothing: spans are annotated "
+        "by the 'onto_matcher' pipe of the OntoRuler pipeline.",
+        DeprecationWarning,
+        stacklevel=2,
+    )
     return doc
 
 
-def get_knowledge_base_enitities(doc: Doc, onto_ruler_obj: OntoRuler) -> pd.DataFrame:
+def get_knowledge_base_enitities(
+    doc: "Doc", onto_ruler_obj: "OntoRuler", document_id=None
+) -> List[dict]:
     """Get information from the SciSpacy pipeline.
 
     :param doc: Doc object.
     :param onto_ruler_obj: OntoRuler object.
-    :return: Pandas DataFrame.
+    :param document_id: Id of the document, included in every record.
+    :return: List of records keyed by KB_ENTITY_COLUMNS.
     """
     linker = onto_ruler_obj.nlp.get_pipe("scispacy_linker")
-    ent_dict = {}
-    key_list = ["cui", "matched_term", "aliases", "definition", "tui"]
-    for k in key_list:
-        ent_dict[k] = []
+    records = []
 
     for entity in doc.ents:
         for kb_ent in entity._.kb_ents:
             ent_object = linker.kb.cui_to_entity[kb_ent[0]]
-            ent_dict["cui"].append(ent_object.concept_id)
-            ent_dict["matched_term"].append(ent_object.canonical_name)
-            ent_dict["aliases"].append(ent_object.aliases)
-            ent_dict["definition"].append(ent_object.definition)
-            ent_dict["tui"].append(ent_object.types)
+            records.append(
+                {
+                    "document_id": document_id,
+                    "cui": ent_object.concept_id,
+                    "matched_term": ent_object.canonical_name,
+                    "aliases": ent_object.aliases,
+                    "definition": ent_object.definition,
+                    "tui": ent_object.types,
+                }
+            )
 
-    return pd.DataFrame.from_dict(ent_dict)
+    return records
 
 
-def export_tsv(df: pd.DataFrame, data_dir: str, fn: str) -> None:
+def export_tsv(df: pd.DataFrame, data_dir: str, fn: str, append: bool = False) -> None:
     """Export pandas DataFrame object into a TSV file.
 
     :param df: Pandas DataFrame.
     :param data_dir: Destination directory for export.
     :param fn: Filename.
+    :param append: Append rows (without header) to an existing file.
     """
     fn_path = join(data_dir, OUTPUT_DIR_NAME, fn + ".tsv")
-    df.to_csv(fn_path, sep="\t", index=None)
+    df.to_csv(
+        fn_path, sep="\t", index=None, mode="a" if append else "w", header=not append
+    )
+
+
+def iter_input_chunks(
+    input_file_list: List[str], chunk_size: Optional[int] = None
+) -> Iterator[pd.DataFrame]:
+    """Iterate over input documents in chunks.
+
+    :param input_file_list: Input TSV files.
+    :param chunk_size: Number of documents per chunk
+        (None reads all input files as one chunk).
+    :return: Iterator of pandas DataFrames.
+    """
+    if chunk_size is None:
+        yield pd.concat(
+            [pd.read_csv(fn, sep="\t", low_memory=False) for fn in input_file_list],
+            axis=0,
+            ignore_index=True,
+        )
+    else:
+        for fn in input_file_list:
+            yield from pd.read_csv(fn, sep="\t", chunksize=chunk_size)
+
+
+def process_documents(
+    input_df: pd.DataFrame, onto_ruler_obj: "OntoRuler", batch_size: int = 10000
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Run the NER pipeline on a DataFrame of documents.
+
+    :param input_df: Pandas DataFrame with 'id' and 'text' columns.
+    :param onto_ruler_obj: OntoRuler object.
+    :param batch_size: Batch size for nlp.pipe.
+    :return: Ontology matches and sciSpacy knowledge base entities.
+    """
+    onto_records = []
+    kb_records = []
+    docs = onto_ruler_obj.nlp.pipe(input_df["text"].values, batch_size=batch_size)
+    stage_timer = StageTimer()
+    for document_id, doc in zip(input_df["id"].values, docs):
+        stage_timer.lap("nlp_pipe")
+        onto_records.extend(get_token_info(doc, document_id))
+        kb_records.extend(
+            get_knowledge_base_enitities(doc, onto_ruler_obj, document_id)
+        )
+        stage_timer.lap("get_token_info")
+    stage_timer.record(documents=len(input_df))
+
+    onto_df = util.apply_result_dtypes(
+        pd.DataFrame.from_records(onto_records, columns=TOKEN_INFO_COLUMNS)
+    )
+    kb_df = pd.DataFrame.from_records(kb_records, columns=KB_ENTITY_COLUMNS)
+    return onto_df, kb_df
+
+
+# OntoRuler of a worker process, either inherited at fork time
+# or loaded (from the serialized term index) by _init_worker.
+_WORKER_ONTO_RULER: Optional["OntoRuler"] = None
+
+
+def _init_worker(onto_ruler_kwargs: dict) -> None:
+    global _WORKER_ONTO_RULER
+    if _WORKER_ONTO_RULER is None:
+        from ontorunner.pipes.OntoRuler import OntoRuler
+
+        _WORKER_ONTO_RULER = OntoRuler(**onto_ruler_kwargs)
+
+
+def _process_documents_worker(
+    input_df: pd.DataFrame,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    return process_documents(input_df, _WORKER_ONTO_RULER)
+
+
+def iter_processed_chunks(
+    onto_ruler_obj: "OntoRuler",
+    onto_ruler_kwargs: dict,
+    input_file_list: List[str],
+    chunk_size: Optional[int] = None,
+    workers: int = 1,
+) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Run the NER pipeline over input chunks, optionally in a process pool.
+
+    Results are yielded in input order regardless of the number of workers.
+
+    :param onto_ruler_obj: OntoRuler object.
+    :param onto_ruler_kwargs: Arguments to build an OntoRuler in a worker
+        where it cannot be inherited from the parent process.
+    :param input_file_list: Input TSV files.
+    :param chunk_size: Number of documents per chunk.
+    :param workers: Number of worker processes.
+    :return: Iterator of ontology matches and sciSpacy entities per chunk.
+    """
+    if workers <= 1:
+        for input_df in iter_input_chunks(input_file_list, chunk_size):
+            yield process_documents(input_df, onto_ruler_obj)
+        return
+
+    global _WORKER_ONTO_RULER
+    if "fork" in multiprocessing.get_all_start_methods():
+        # Workers share the parent's OntoRuler copy-on-write.
+        context = multiprocessing.get_context("fork")
+        _WORKER_ONTO_RULER = onto_ruler_obj
+    else:
+        # Every worker loads its own OntoRuler: only the memory-mapped
+        # term tables are shared, each builds its own PhraseMatcher.
+        context = multiprocessing.get_context("spawn")
+    try:
+        with context.Pool(
+            processes=workers,
+            initializer=_init_worker,
+            initargs=(onto_ruler_kwargs,),
+        ) as pool:
+            yield from imap_bounded(
+                pool,
+                _process_documents_worker,
+                iter_input_chunks(
+                    input_file_list, chunk_size or DEFAULT_WORKER_CHUNK_SIZE
+                ),
+                window=2 * workers,
+            )
+    finally:
+        _WORKER_ONTO_RULER = None
 
 
 @click.group()
@@ -237,7 +355,12 @@ def run_spacy(
     to_pickle: bool = True,
     need_ancestors: bool = False,
     viz: bool = False,
-) -> OntoRuler:
+    chunk_size: Optional[int] = None,
+    workers: int = 1,
+    report_file: Optional[str] = None,
+    profile_dir: Optional[str] = None,
+    output_format: str = "tsv",
+) -> "OntoRuler":
     """
     Run spacy with sciSpacy pipeline.
 
@@ -247,8 +370,17 @@ def run_spacy(
     :param to_pickle: Pickle intermediate files. (True/False)
     :param need_ancestors: Include ancestors of annotated terms. (True/False)
     :param viz: Include visualizations (png and svg) in output. (True/False)
+    :param chunk_size: Number of documents processed at a time; input is
+        streamed and output appended chunk by chunk (None loads all input).
+    :param workers: Number of worker processes. Multiple workers always
+        process the input in chunks (1000 documents unless `chunk_size`).
+    :param report_file: Write per-stage timings (JSON or TSV) to this file.
+    :param profile_dir: Write per-stage cProfile dumps to this directory.
+    :param output_format: Format of the output files ('tsv', 'parquet'
+        or 'arrow').
     :return: OntoRuler object.
     """
+    from ontorunner.pipes.OntoRuler import OntoRuler
 
     if linker not in SCI_SPACY_LINKERS:
         raise (
@@ -257,63 +389,125 @@ def run_spacy(
                 f"Choose one of the following: {SCI_SPACY_LINKERS}"
             )
         )
-    onto_ruler_obj = OntoRuler(
-        data_dir=data_dir,
-        settings_filepath=settings_file,
-        linker=linker,
-        to_pickle=to_pickle,
-    )
-    batch_size = 10000
-    input_dir_path = join(data_dir, INPUT_DIR_NAME) + "/*.tsv"
-    input_file_list = glob(input_dir_path)
-    list_of_input_dfs = []
-    for fn in input_file_list:
-        in_df = pd.read_csv(fn, sep="\t", low_memory=False)
-        list_of_input_dfs.append(in_df)
-
-    input_df = pd.concat(list_of_input_dfs, axis=0, ignore_index=True)
-
-    input_df["spacy_doc"] = list(
-        onto_ruler_obj.nlp.pipe(input_df["text"].values, batch_size=batch_size)
-    )
-
-    input_df["spacy_doc_tok"] = input_df["spacy_doc"].apply(
-        lambda row: onto_tokenize(row, onto_ruler_obj)
-    )
-
-    input_df["spacy_tokens"] = input_df["spacy_doc_tok"].apply(
-        lambda row: get_token_info(row)
-    )
-
-    input_df["spacy_kb_ent"] = input_df["spacy_doc_tok"].apply(
-        lambda row: get_knowledge_base_enitities(row, onto_ruler_obj)
-    )
-
-    kb_df = explode_df(input_df[["id", "spacy_kb_ent"]])
-    onto_df = explode_df(input_df[["id", "spacy_tokens"]])
-    # nlp_df = doc_to_df(dframcy, input_df[["id", "spacy_doc"]])
-
-    stopwords_file_path = join(data_dir, _get_config("termlist_stopwords")[0])
-    stopwords_file = open(stopwords_file_path, "r")
-    stopwords = stopwords_file.read().splitlines()
-    onto_df = onto_df.loc[~onto_df["matched_term"].isin(stopwords)]
-
-    onto_df = util.consolidate_rows(onto_df)
-    onto_df = util.get_column_doc_ratio(onto_df, "object_label")
-    onto_df = util.get_column_doc_ratio(onto_df, "matched_term")
-    if need_ancestors:
-        nodes_and_edges_dir = join(data_dir, NODE_AND_EDGE_NAME)
-        onto_df = util.get_ancestors(
-            df=onto_df, nodes_and_edges_dir=nodes_and_edges_dir
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Output format '{output_format}' is invalid. "
+            f"Choose one of the following: {list(OUTPUT_FORMATS)}"
         )
-
-    onto_df = onto_df.astype(str).drop_duplicates()
-    kb_df = kb_df.astype(str).drop_duplicates()
-
-    export_tsv(kb_df, data_dir, "sciSpacy_" + linker + "_ontoRunNER")
-    export_tsv(onto_df, data_dir, "ontology_ontoRunNER")
-
-    return onto_ruler_obj
+    with recording(report_file, profile_dir):
+        onto_ruler_kwargs = {
+            "data_dir": data_dir,
+            "settings_filepath": settings_file,
+            "linker": linker,
+            "to_pickle": to_pickle,
+        }
+        onto_ruler_obj = OntoRuler(**onto_ruler_kwargs)
+        input_dir_path = join(data_dir, INPUT_DIR_NAME) + "/*.tsv"
+        input_file_list = glob(input_dir_path)
+
+        stopwords_file_path = join(data_dir, _get_config("termlist_stopwords")[0])
+        stopwords_file = open(stopwords_file_path, "r")
+        stopwords = stopwords_file.read().splitlines()
+
+        output_dir = join(data_dir, OUTPUT_DIR_NAME)
+        output_extension = OUTPUT_FORMATS[output_format]
+        onto_path = join(output_dir, "ontology_ontoRunNER" + output_extension)
+        kb_path = join(
+            output_dir, "sciSpacy_" + linker + "_ontoRunNER" + output_extension
+        )
+        # The document ratios can only be attached once every chunk is
+        # seen. A single chunk is finished in memory; with more, matches
+        # are first written to an intermediate file.
+        tmp_onto_path = join(output_dir, ".ontology_ontoRunNER.tmp" + output_extension)
+        doc_ratio_columns = ["object_label", "matched_term"]
+        doc_counts = {column: pd.Series(dtype=int) for column in doc_ratio_columns}
+        total_docs = 0
+        # Built once per ontology and reused by every chunk.
+        ancestor_indexes = {}
+
+        def finish_chunk(onto_df: pd.DataFrame, onto_writer: ResultWriter) -> None:
+            with stage("doc_ratio", rows=len(onto_df)):
+                onto_df = util.apply_result_dtypes(
+                    util.add_doc_ratios(onto_df, doc_counts, total_docs)
+                )
+            if need_ancestors:
+                with stage("ancestors", rows=len(onto_df)):
+                    onto_df = util.get_ancestors(
+                        df=onto_df,
+                        nodes_and_edges_dir=join(data_dir, NODE_AND_EDGE_NAME),
+                        serial_dir=(
+                            join(data_dir, SERIAL_DIR_NAME) if to_pickle else None
+                        ),
+                        ancestor_indexes=ancestor_indexes,
+                    )
+            with stage("export", rows=len(onto_df)):
+                onto_writer.write(util.drop_duplicate_rows(onto_df))
+
+        # The last chunk seen, written out only once another one follows.
+        pending_df = None
+        tmp_writer = None
+        try:
+            with ResultWriter(kb_path, output_format) as kb_writer:
+                for onto_df, kb_df in iter_processed_chunks(
+                    onto_ruler_obj,
+                    onto_ruler_kwargs,
+                    input_file_list,
+                    chunk_size,
+                    workers,
+                ):
+                    with stage("export", rows=len(kb_df)):
+                        kb_writer.write(kb_df.astype(str).drop_duplicates())
+
+                    if onto_df.empty:
+                        continue
+                    with stage("consolidate", rows=len(onto_df)):
+                        onto_df = onto_df.loc[~onto_df["matched_term"].isin(stopwords)]
+                        onto_df = util.consolidate_rows(onto_df)
+                    with stage("doc_ratio", rows=len(onto_df)):
+                        chunk_doc_counts = util.get_doc_counts(
+                            onto_df, doc_ratio_columns
+                        )
+                        for column in doc_ratio_columns:
+                            onto_df[column] = onto_df[column].str.lower()
+                            doc_counts[column] = doc_counts[column].add(
+                                chunk_doc_counts[column], fill_value=0
+                            )
+                        onto_df = util.drop_duplicate_rows(onto_df)
+                        # A document never spans chunks, so per-chunk counts
+                        # add up.
+                        total_docs += len(onto_df["document_id"].drop_duplicates())
+
+                    if pending_df is not None:
+                        if tmp_writer is None:
+                            tmp_writer = ResultWriter(tmp_onto_path, output_format)
+                        with stage("export", rows=len(pending_df)):
+                            tmp_writer.write(pending_df)
+                    pending_df = onto_df
+
+            with ResultWriter(onto_path, output_format) as onto_writer:
+                if tmp_writer is None:
+                    if pending_df is not None:
+                        finish_chunk(pending_df, onto_writer)
+                else:
+                    with stage("export", rows=len(pending_df)):
+                        tmp_writer.write(pending_df)
+                    pending_df = None
+                    tmp_writer.close()
+                    tmp_writer = None
+                    for onto_df in iter_results(
+                        tmp_onto_path,
+                        chunk_size or 100_000,
+                        dtype=str,
+                        keep_default_na=False,
+                    ):
+                        finish_chunk(onto_df, onto_writer)
+        finally:
+            if tmp_writer is not None:
+                tmp_writer.close()
+            if os.path.exists(tmp_onto_path):
+                os.remove(tmp_onto_path)
+
+        return onto_ruler_obj
     # if viz:
     #     # TODO: Need robust implementation depending on input.
     #     run_viz(DEFAULT_TEXT, onto_ruler_obj)
@@ -343,6 +537,35 @@ def run_spacy(
 )
 @click.option("--need-ancestors", "-a", type=bool, default=False)
 @click.option("--viz", "-v", type=bool, default=False)
+@click.option(
+    "--chunk-size",
+    "-c",
+    type=int,
+    help="Number of documents processed at a time (streams input and output).",
+    default=None,
+)
+@click.option("--workers", "-w", help="Number of worker processes.", default=1)
+@click.option(
+    "--report",
+    "-r",
+    type=click.Path(),
+    help="Write per-stage timings to this file (.json or .tsv).",
+    default=None,
+)
+@click.option(
+    "--profile-dir",
+    type=click.Path(),
+    help="Write per-stage cProfile dumps to this directory.",
+    default=None,
+)
+@click.option(
+    "--output-format",
+    "-f",
+    type=click.Choice(list(OUTPUT_FORMATS)),
+    help="Format of the output files (parquet and arrow need pyarrow).",
+    default="tsv",
+    show_default=True,
+)
 def run_spacy_click(
     data_dir: Path,
     settings_file: Path,
@@ -350,6 +573,11 @@ def run_spacy_click(
     pickle_files: bool,
     need_ancestors: bool,
     viz: bool,
+    chunk_size: Optional[int],
+    workers: int,
+    report: Optional[str],
+    profile_dir: Optional[str],
+    output_format: str,
 ):
     """CLI for running the spacy module.
 
@@ -360,6 +588,11 @@ def run_spacy_click(
         must be pickled or not.
     :param need_ancestors: Bool indicatind if output should.
         contain ancestors of matched term or not.
+    :param chunk_size: Number of documents processed at a time.
+    :param workers: Number of worker processes.
+    :param report: Per-stage timings file.
+    :param profile_dir: Per-stage cProfile dumps directory.
+    :param output_format: Format of the output files.
     """
     run_spacy(
         data_dir=data_dir,
@@ -368,14 +601,96 @@ def run_spacy_click(
         to_pickle=pickle_files,
         need_ancestors=need_ancestors,
         viz=viz,
+        chunk_size=chunk_size,
+        workers=workers,
+        report_file=report,
+        profile_dir=profile_dir,
+        output_format=output_format,
     )
 
 
-def run_viz(input_text: str = DEFAULT_TEXT, obj: OntoRuler = None):
+@main.command("serve")
+@click.option("-d", "--data-dir", help="Data directory path.", default=DATA_DIR)
+@click.option(
+    "-s",
+    "--settings-file",
+    help="settings.ini file path.",
+    default=SETTINGS_FILE_PATH,
+)
+@click.option(
+    "-l",
+    "--linker",
+    type=click.Choice(SCI_SPACY_LINKERS),
+    help="Which sciSpacy linker to use.('umls'/'mesh'/'go'/'hpo'/'rxnorm')",
+    default="umls",
+    show_default=True,
+)
+@click.option("--host", help="Host to listen on.", default=DEFAULT_HOST)
+@click.option("--port", type=int, help="Port to listen on.", default=DEFAULT_PORT)
+@click.option("--workers", "-w", help="Number of worker processes.", default=1)
+@click.option(
+    "--max-batch-size",
+    type=int,
+    help="Maximum number of documents annotated in one batch.",
+    default=DEFAULT_MAX_BATCH_SIZE,
+)
+@click.option(
+    "--max-wait",
+    type=float,
+    help="Seconds a request waits for others to be batched with.",
+    default=DEFAULT_MAX_WAIT,
+)
+def serve_click(
+    data_dir: Path,
+    settings_file: Path,
+    linker: str,
+    host: str,
+    port: int,
+    workers: int,
+    max_batch_size: int,
+    max_wait: float,
+):
+    """Serve annotation requests over HTTP, keeping the models loaded.
+
+    POST {"documents": [{"id": .., "text": ..}]} to /annotate.
+
+    :param data_dir: Data directory path.
+    :param settings_file: Filepath for settings.ini file.
+    :param linker: Type of sciSpacy linker desired ([umls]/mesh).
+    :param host: Host to listen on.
+    :param port: Port to listen on.
+    :param workers: Number of worker processes.
+    :param max_batch_size: Maximum number of documents per batch.
+    :param max_wait: Seconds a request waits for others to batch with.
+    """
+    from ontorunner.server import SpacyBackend, serve
+
+    backend_kwargs = {
+        "data_dir": data_dir,
+        "settings_filepath": settings_file,
+        "linker": linker,
+    }
+    serve(
+        SpacyBackend(**backend_kwargs),
+        backend_kwargs,
+        host,
+        port,
+        workers,
+        max_batch_size,
+        max_wait,
+    )
+
+
+def run_viz(input_text: str = DEFAULT_TEXT, obj: "OntoRuler" = None):
     """Text that needs to be annotated.
 
     :param input_text:Text to be annotated, defaults to DEFAULT_TEXT
     """
+    import cairosvg
+    from spacy import displacy
+
+    from ontorunner.pipes.OntoRuler import OntoRuler
+
     # Determine the input_text type.
     if isfile(input_text):
         fn, ext = splitext(input_text)
@@ -0,0 +1,70 @@
+"""File fingerprints and process pool helpers shared across modules."""
+import hashlib
+import os
+from collections import deque
+from typing import Callable, Iterable, Iterator
+
+
+def get_file_hash(filepath: str, block_size: int = 1 << 20) -> str:
+    """Get the SHA-256 hex digest of a file.
+
+    :param filepath: File path.
+    :param block_size: Number of bytes read at a time.
+    :return: Hex digest.
+    """
+    sha = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def get_file_fingerprint(filepath: str) -> dict:
+    """Get the size, modification time and hash of a file.
+
+    :param filepath: File path.
+    :return: Fingerprint dictionary.
+    """
+    stat = os.stat(filepath)
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "sha256": get_file_hash(filepath),
+    }
+
+
+def is_fingerprint_current(filepath: str, fingerprint: dict) -> bool:
+    """Check whether a file still matches its fingerprint.
+
+    :param filepath: File path.
+    :param fingerprint: Fingerprint as returned by get_file_fingerprint.
+    :return: True if the file is unchanged.
+    """
+    # size + mtime is the cheap check; the hash settles touched-but-unchanged files.
+    stat = os.stat(filepath)
+    if stat.st_size != fingerprint.get("size"):
+        return False
+    if stat.st_mtime_ns == fingerprint.get("mtime"):
+        return True
+    return get_file_hash(filepath) == fingerprint.get("sha256")
+
+
+def imap_bounded(pool, func: Callable, iterable: Iterable, window: int) -> Iterator:
+    """Map a function over an iterable in a pool, in order.
+
+    Like pool.imap, but only keeps `window` tasks in flight instead of
+    consuming the whole input up front, so streamed input stays streamed.
+
+    :param pool: multiprocessing Pool.
+    :param func: Function applied to every item.
+    :param iterable: Input items.
+    :param window: Maximum number of tasks in flight.
+    :return: Iterator of results, in input order.
+    """
+    pending: deque = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+
+from ontorunner.converters import biohub_converter as bc
+
+NODES = [
+    "id\tcategory\tname\tprovided_by\tsynonym",
+    "X:1\tbiolink:NamedThing\tsoil\tx\tdirt|Soil",
+    "X:2\tbiolink:Publication\tpaper\tx\t",
+    "X:3\tbiolink:NamedThing\t\tx\t",
+    "X:4\tbiolink:NamedThing\triver\tx\t",
+]
+
+
+class TestBiohubConverter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.nodes_dir = os.path.join(self.tmpdir.name, "nodes_and_edges")
+        self.terms_dir = os.path.join(self.tmpdir.name, "terms")
+        os.makedirs(self.nodes_dir)
+        self.nodes_file = os.path.join(self.nodes_dir, "x_nodes.tsv")
+        with open(self.nodes_file, "w") as f:
+            f.write("\n".join(NODES) + "\n")
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_parse(self) -> None:
+        serial = os.path.join(self.tmpdir.name, "serial.tsv")
+        parallel = os.path.join(self.tmpdir.name, "parallel.tsv")
+        skipped = bc.parse(self.nodes_file, serial)
+        bc.parse(self.nodes_file, parallel, workers=2, chunk_size=1)
+        self.assertDictEqual(skipped, {"excluded_category": 1, "missing_name": 1})
+        with open(serial) as sf, open(parallel) as pf:
+            serial_lines = sf.read().splitlines()
+            self.assertListEqual(serial_lines, pf.read().splitlines())
+        self.assertListEqual(
+            [line.split("\t")[2] for line in serial_lines],
+            ["X:1_SYNONYM", "X:1", "X:4"],
+        )
+
+    def test_parse_directory(self) -> None:
+        termlist = os.path.join(self.terms_dir, "x_termlist.tsv")
+        self.assertListEqual(
+            bc.parse_directory(self.nodes_dir, self.terms_dir), [termlist]
+        )
+        self.assertListEqual(bc.parse_directory(self.nodes_dir, self.terms_dir), [])
+
+        with open(self.nodes_file, "a") as f:
+            f.write("X:5\tbiolink:NamedThing\tsand\tx\t\n")
+        self.assertListEqual(
+            bc.parse_directory(self.nodes_dir, self.terms_dir), [termlist]
+        )
+        with open(termlist) as f:
+            self.assertEqual(len(f.read().splitlines()), 4)
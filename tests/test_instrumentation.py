@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from ontorunner.instrumentation import StageTimer, recording, stage
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_recording(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            report_file = os.path.join(tmpdir, "report.json")
+            profile_dir = os.path.join(tmpdir, "profiles")
+            with recording(report_file, profile_dir):
+                for _ in range(2):
+                    with stage("consolidate", rows=10) as stage_counts:
+                        stage_counts["documents"] = 3
+                with recording():
+                    # Nested runs are recorded into the outer report.
+                    stage_timer = StageTimer()
+                    stage_timer.lap("nlp_pipe")
+                    stage_timer.record(documents=5)
+
+            with open(report_file) as rf:
+                stages = json.load(rf)["stages"]
+            self.assertListEqual(
+                [s["stage"] for s in stages], ["consolidate", "nlp_pipe"]
+            )
+            self.assertEqual(stages[0]["calls"], 2)
+            self.assertEqual(stages[0]["rows"], 20)
+            self.assertEqual(stages[0]["documents"], 6)
+            self.assertEqual(stages[1]["documents"], 5)
+            self.assertTrue(
+                os.path.isfile(os.path.join(profile_dir, "consolidate.prof"))
+            )
+
+    def test_recording_tsv(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            report_file = os.path.join(tmpdir, "report.tsv")
+            with recording(report_file):
+                with stage("export", rows=4):
+                    pass
+            report_df = pd.read_csv(report_file, sep="\t")
+        self.assertListEqual(
+            report_df.columns.tolist(),
+            ["stage", "calls", "wall_time", "cpu_time", "peak_rss_mb", "rows"],
+        )
+        self.assertEqual(report_df.loc[0, "rows"], 4)
+
+    def test_stage_without_recording(self) -> None:
+        with stage("export", rows=1) as stage_counts:
+            stage_counts["documents"] = 1
+        self.assertDictEqual(stage_counts, {"rows": 1, "documents": 1})
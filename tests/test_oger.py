@@ -1,10 +1,11 @@
 import os
+import tempfile
 import unittest
 
 import pandas as pd
 
 from ontorunner.oger_module import run_oger
-from ontorunner.pre.util import json2tsv, prepare_termlist
+from ontorunner.pre.util import json2tsv, json2tsv_batch, prepare_termlist
 
 from . import cleanup
 
@@ -35,6 +36,18 @@ class TestOger(unittest.TestCase):
             self.assertTrue(os.path.isfile(file))
             self.assertEqual(len(pd.read_csv(file, sep="\t")), ofile_rows[i])
 
+    def test_json2tsv_batch_skips_up_to_date(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            json_file = os.path.join(tmpdir, "envo.json")
+            with open(json_file, "w") as f:
+                f.write("{}")
+            for suffix in ["_nodes.tsv", "_edges.tsv"]:
+                with open(os.path.join(tmpdir, "envo" + suffix), "w") as f:
+                    f.write("id\n")
+                os.utime(os.path.join(tmpdir, "envo" + suffix), ns=(0, 1 << 62))
+            timings = json2tsv_batch(tmpdir, tmpdir)
+        self.assertDictEqual(timings, {json_file: None})
+
     def test_prepare_termlist(self) -> None:
         ifile = os.path.join(self.output, "envo_nodes.tsv")
         prepare_termlist(ifile, self.termlist)
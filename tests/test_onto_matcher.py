@@ -0,0 +1,140 @@
+import unittest
+
+import spacy
+
+from ontorunner.pipes.onto_matcher import OntoMatcher  # noqa F401
+from ontorunner.pipes.OntoRuler import OntoRuler
+from ontorunner.pipes.term_index import TermIndex
+from ontorunner.spacy_module import get_token_info, onto_tokenize
+
+
+class TestOntoMatcher(unittest.TestCase):
+    def setUp(self) -> None:
+        self.nlp = spacy.blank("en")
+        self.onto_matcher = self.nlp.add_pipe("onto_matcher")
+        records = [
+            {
+                "matched_term": "creek",
+                "object_id": "ENVO:00000023",
+                "object_category": "biolink:NamedThing",
+                "object_label": "stream",
+                "object_match_field": "hasRelatedSynonym",
+                "origin": "envo.json",
+            },
+            {
+                "matched_term": "creek sediment",
+                "object_id": "ENVO:00002007",
+                "object_category": "biolink:NamedThing",
+                "object_label": "creek sediment",
+                "object_match_field": "",
+                "origin": "envo.json",
+            },
+            {
+                "matched_term": "acetate",
+                "object_id": "CHEBI:30089",
+                "object_category": "biolink:ChemicalEntity",
+                "object_label": "acetate",
+                "object_match_field": "",
+                "origin": "chebi.json",
+            },
+            {
+                "matched_term": "Acetate",
+                "object_id": "CHEBI:30089",
+                "object_category": "biolink:ChemicalEntity",
+                "object_label": "acetate",
+                "object_match_field": "",
+                "origin": "chebi.json",
+            },
+            {
+                "matched_term": "acetate",
+                "object_id": "NCIT:C28264",
+                "object_category": "biolink:ChemicalEntity",
+                "object_label": "acetate",
+                "object_match_field": "",
+                "origin": "ncit.json",
+            },
+        ]
+        docs = list(self.nlp.tokenizer.pipe([r["matched_term"] for r in records]))
+        self.onto_matcher.load_term_index(TermIndex.from_records(records, docs))
+
+    def test_call(self) -> None:
+        doc = self.nlp("Creek sediment microcosms oxidize acetate.")
+        self.assertListEqual(
+            [(e.text, e.label_) for e in doc.ents],
+            [
+                ("Creek sediment", "ENVO:00002007 [ creek sediment ]"),
+                ("acetate", "CHEBI:30089 [ acetate ]"),
+            ],
+        )
+        self.assertTrue(all(e._.is_an_ontology_term for e in doc.ents))
+        self.assertEqual(doc.ents[1]._.origin, "chebi.json")
+        # Overlapped matches are annotated but not added to the entities.
+        self.assertEqual(doc[0:1]._.object_label, "stream")
+        self.assertFalse(doc[2:3]._.is_an_ontology_term)
+
+    def test_match(self) -> None:
+        doc = self.nlp.make_doc("Creek sediment microcosms oxidize acetate.")
+        self.assertListEqual(
+            sorted(self.onto_matcher.match(doc)),
+            [(0, 0, 1), (1, 0, 2), (2, 4, 5), (4, 4, 5)],
+        )
+        self.assertEqual(self.onto_matcher.get_term(4)["origin"], "ncit.json")
+
+    def test_get_token_info(self) -> None:
+        self.nlp.add_pipe("sentencizer")
+        doc = self.nlp("Soil bacteria oxidize acetate.")
+        records = get_token_info(doc, document_id=1)
+        self.assertListEqual(
+            [(r["matched_term"], r["object_id"], r["origin"]) for r in records],
+            [
+                ("acetate", "CHEBI:30089", "chebi.json"),
+                ("acetate", "NCIT:C28264", "ncit.json"),
+            ],
+        )
+
+    def test_existing_entities(self) -> None:
+        doc = self.nlp.make_doc("Creek sediment microcosms oxidize acetate.")
+        doc.ents = [spacy.tokens.Span(doc, 0, 1, label="TAXON")]
+        doc = self.onto_matcher(doc)
+        self.assertListEqual(
+            [(e.text, e.label_) for e in doc.ents],
+            [("Creek", "TAXON"), ("acetate", "CHEBI:30089 [ acetate ]")],
+        )
+        self.assertEqual(doc.ents[0]._.object_id, "ENVO:00000023")
+
+    def test_onto_ruler_terms(self) -> None:
+        onto_ruler = OntoRuler.__new__(OntoRuler)
+        onto_ruler.onto_matcher = self.onto_matcher
+        terms = onto_ruler.terms
+        self.assertListEqual(sorted(terms), ["acetate", "creek", "creek sediment"])
+        # The first term of a surface form.
+        self.assertDictEqual(
+            terms["acetate"],
+            {
+                "object_id": "CHEBI:30089",
+                "object_category": "biolink:ChemicalEntity",
+                "object_label": "acetate",
+                "object_match_field": "",
+                "origin": "chebi.json",
+            },
+        )
+        self.assertIs(onto_ruler.terms, terms)
+        # Loading a term index resets the terms.
+        records = [
+            {
+                "matched_term": "soil",
+                "object_id": "ENVO:00001998",
+                "object_category": "biolink:NamedThing",
+                "object_label": "soil",
+                "object_match_field": "",
+                "origin": "envo.json",
+            }
+        ]
+        docs = list(self.nlp.tokenizer.pipe(["soil"]))
+        onto_ruler.load_term_index(TermIndex.from_records(records, docs))
+        self.assertListEqual(sorted(onto_ruler.terms), ["soil"])
+
+    def test_onto_tokenize(self) -> None:
+        doc = self.nlp("Creek sediment microcosms oxidize acetate.")
+        with self.assertWarns(DeprecationWarning):
+            self.assertIs(onto_tokenize(doc, None), doc)
@@ -1,10 +1,21 @@
 import os
+import tempfile
 import unittest
+from unittest import mock
 
+import nltk
 import numpy as np
 import pandas as pd
+from click.testing import CliRunner
 
-from ontorunner.post.util import get_ancestors
+from ontorunner.post import NLTK_RESOURCES
+from ontorunner.post import util as post_util
+from ontorunner.post.add_sentence import get_similarity_features, sentencify
+from ontorunner.post.util import (AncestorIndex, add_doc_ratios,
+                                  apply_result_dtypes, consolidate_rows,
+                                  get_ancestors, get_doc_counts,
+                                  get_doc_ratios)
+from ontorunner.pre.util import download_nltk_data
 
 cwd = os.path.abspath(os.path.dirname(__file__))
 data_dir = os.path.join(cwd, "data")
@@ -24,8 +35,253 @@ class TestPost(unittest.TestCase):
 
     def test_get_ancestors(self) -> None:
         """Testing the get_ancestors method."""
-        df_with_ancestors = get_ancestors(self.df, self.node_and_edge_dir)
+        df_with_ancestors = get_ancestors(
+            self.df, self.node_and_edge_dir, serial_dir=None
+        )
         valid_ouput_df = pd.read_csv(
             self.valid_ancestor_output, sep="\t", low_memory=False
         ).replace(np.nan, "")
         pd.testing.assert_frame_equal(df_with_ancestors, valid_ouput_df)
+
+    def test_ancestor_index_multiple_parents(self) -> None:
+        """Testing the AncestorIndex closure over multiple parents."""
+        edges_df = pd.DataFrame(
+            {
+                "subject": ["A", "A", "B", "C", "D"],
+                "object": ["B", "C", "D", "D", "E"],
+            }
+        )
+        ancestor_index = AncestorIndex.from_edges_df(edges_df)
+        self.assertEqual(ancestor_index.ancestors("A"), ["B", "C", "D", "E"])
+        self.assertEqual(ancestor_index.ancestors("C"), ["D", "E"])
+        self.assertEqual(ancestor_index.ancestors("E"), [])
+
+    def test_ancestor_index_cycle(self) -> None:
+        """Testing that every node of a subclass cycle gets its ancestors."""
+        edges_df = pd.DataFrame(
+            {
+                "subject": ["A", "B", "C", "D", "D", "F"],
+                "object": ["B", "C", "D", "B", "E", "F"],
+            }
+        )
+        ancestor_index = AncestorIndex.from_edges_df(edges_df)
+        self.assertEqual(ancestor_index.ancestors("A"), ["B", "C", "D", "E"])
+        for curie in ["B", "C", "D"]:
+            self.assertSetEqual(
+                set(ancestor_index.ancestors(curie)), {"B", "C", "D", "E"} - {curie}
+            )
+        self.assertEqual(ancestor_index.ancestors("F"), [])
+
+    def test_ancestor_index_cache(self) -> None:
+        """Testing that the serialized ancestor index is reused."""
+        edges_file = os.path.join(self.node_and_edge_dir, "mop_edges.tsv")
+        with tempfile.TemporaryDirectory() as serial_dir:
+            built = AncestorIndex.from_edges_file(edges_file, serial_dir)
+            cached = AncestorIndex.from_edges_file(edges_file, serial_dir)
+            self.assertIsInstance(cached.closure_indices, np.memmap)
+            for curie in built.nodes:
+                self.assertEqual(built.ancestors(curie), cached.ancestors(curie))
+
+            # A same-named edges file elsewhere gets its own cache.
+            with tempfile.TemporaryDirectory() as other_dir:
+                other_edges_file = os.path.join(other_dir, "mop_edges.tsv")
+                pd.DataFrame(
+                    {
+                        "subject": ["A"],
+                        "predicate": ["biolink:subclass_of"],
+                        "object": ["B"],
+                    }
+                ).to_csv(other_edges_file, sep="\t", index=False)
+                other = AncestorIndex.from_edges_file(other_edges_file, serial_dir)
+                self.assertListEqual(other.nodes, ["A", "B"])
+                cached = AncestorIndex.from_edges_file(edges_file, serial_dir)
+                self.assertIsInstance(cached.closure_indices, np.memmap)
+                self.assertEqual(cached.nodes, built.nodes)
+
+    def test_consolidate_rows(self) -> None:
+        """Testing that duplicate rows are merged across origins."""
+        df = pd.DataFrame(
+            {
+                "document_id": [1, 1, 2, 1, 2],
+                "object_id": ["A", "A", "B", None, "B"],
+                "object_match_field": [None, None, "x", None, "x"],
+                "empty": [None] * 5,
+                "origin": ["o1", "o2", "o1", "o3", "o3"],
+            }
+        )
+        consolidated_df = consolidate_rows(df)
+        expected_df = pd.DataFrame(
+            {
+                "document_id": [1, 2, 1],
+                "object_id": ["A", "B", None],
+                "object_match_field": ["", "x", ""],
+                "origin": ["o1 | o2", "o1 | o3", "o3"],
+            }
+        )
+        pd.testing.assert_frame_equal(consolidated_df, expected_df)
+
+    def test_consolidate_rows_categorical(self) -> None:
+        """Testing consolidation of rows with compact dtypes."""
+        df = apply_result_dtypes(
+            pd.DataFrame(
+                {
+                    "document_id": [1, 1, 2],
+                    "object_id": ["A", "A", "B"],
+                    "object_match_field": [None, None, "x"],
+                    "origin": ["o1", "o2", "o1"],
+                    "start": [0, 0, 5],
+                    "jaccard_index": [0.5, 0.5, None],
+                }
+            )
+        )
+        self.assertEqual(df["origin"].dtype, "category")
+        self.assertEqual(df["start"].dtype, np.int32)
+        self.assertEqual(df["jaccard_index"].dtype, np.float32)
+        consolidated_df = consolidate_rows(df)
+        self.assertListEqual(consolidated_df["origin"].tolist(), ["o1 | o2", "o1"])
+        self.assertListEqual(consolidated_df["object_match_field"].tolist(), ["", "x"])
+
+    def test_get_doc_ratios(self) -> None:
+        """Testing the document ratios of several columns."""
+        df = pd.DataFrame(
+            {
+                "document_id": [1, 1, 2, 3, 1],
+                "matched_term": ["Soil", "soil", "soil", "creek", "soil"],
+                "object_label": ["soil", "soil", "soil", "stream", None],
+            }
+        )
+        ratio_df = get_doc_ratios(df, ["object_label", "matched_term"])
+        # The first two rows are duplicates once lowercased.
+        self.assertListEqual(ratio_df.index.tolist(), [0, 2, 3, 4])
+        self.assertListEqual(
+            ratio_df["object_label_doc_count"].fillna(0).tolist(), [2, 2, 1, 0]
+        )
+        self.assertListEqual(
+            ratio_df["matched_term_doc_ratio"].tolist(), [2 / 3, 2 / 3, 1 / 3, 2 / 3]
+        )
+
+    def test_get_doc_ratios_chunked(self) -> None:
+        """Testing that per-chunk document counts give the same ratios."""
+        df = pd.DataFrame(
+            {
+                "document_id": [1, 1, 2, 3, 3, 4],
+                "matched_term": ["Soil", "soil", "creek", "soil", "acetate", "Creek"],
+                "object_label": ["soil", "soil", "stream", "soil", None, "stream"],
+            }
+        )
+        columns = ["object_label", "matched_term"]
+        expected_df = get_doc_ratios(df.copy(), columns)
+
+        # As run_spacy does: count per chunk, then attach the ratios to
+        # every chunk. A document never spans chunks.
+        chunks = [df.iloc[:3].copy(), df.iloc[3:].copy()]
+        doc_counts = {column: pd.Series(dtype=int) for column in columns}
+        total_docs = 0
+        for chunk_df in chunks:
+            chunk_doc_counts = get_doc_counts(chunk_df, columns)
+            for column in columns:
+                doc_counts[column] = doc_counts[column].add(
+                    chunk_doc_counts[column], fill_value=0
+                )
+            total_docs += len(chunk_df["document_id"].drop_duplicates())
+        ratio_df = pd.concat(
+            [add_doc_ratios(chunk_df, doc_counts, total_docs) for chunk_df in chunks]
+        )
+        pd.testing.assert_frame_equal(ratio_df, expected_df)
+
+    def test_ensure_nltk_resources(self) -> None:
+        """Testing that NLTK resources are looked up in the data path."""
+        with tempfile.TemporaryDirectory() as nltk_dir, mock.patch.object(
+            nltk.data, "path", [nltk_dir]
+        ), mock.patch.object(post_util, "_NLTK_RESOURCES_FOUND", set()):
+            os.makedirs(os.path.join(nltk_dir, NLTK_RESOURCES["words"]))
+            self.assertListEqual(
+                post_util.ensure_nltk_resources(["words", "punkt"], download=False),
+                ["punkt"],
+            )
+            self.assertSetEqual(post_util._NLTK_RESOURCES_FOUND, {"words"})
+
+    def test_download_nltk_data(self) -> None:
+        """Testing the download-nltk-data command without downloading."""
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as nltk_dir, mock.patch.object(
+            nltk.data, "path", [nltk_dir]
+        ), mock.patch.object(post_util, "_NLTK_RESOURCES_FOUND", set()):
+            result = runner.invoke(download_nltk_data, ["--no-download"])
+            self.assertEqual(result.exit_code, 1)
+            self.assertIn(", ".join(NLTK_RESOURCES), result.output)
+
+            for path in NLTK_RESOURCES.values():
+                os.makedirs(os.path.join(nltk_dir, path))
+            result = runner.invoke(download_nltk_data, ["--no-download"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("NLTK resources are available!", result.output)
+
+    def test_get_similarity_features(self) -> None:
+        """Testing similarity features are joined back onto every row."""
+        df = pd.DataFrame(
+            {
+                "matched_term": ["Rivers", "soil", "Soil", "cats"],
+                "preferred_form": ["river", "Soil", "soil", "dog"],
+            },
+            index=[4, 2, 7, 1],
+        )
+        features = get_similarity_features(df)
+        self.assertListEqual(features.index.tolist(), [4, 2, 7, 1])
+        self.assertListEqual(
+            features["match_type"].tolist(),
+            ["lemmatic_match", "exact_match", "exact_match", ""],
+        )
+        self.assertListEqual(features["levenshtein_distance"].tolist(), [1, 0, 0, 4])
+
+    def test_sentencify(self) -> None:
+        """Testing matches are assigned the sentence their offsets fall in."""
+        input_df = pd.DataFrame(
+            {
+                "id": [1, 2],
+                "text": ["Soil is wet. Rivers run\tfast.", "Nothing matched here."],
+            }
+        )
+        output_df = pd.DataFrame(
+            {
+                "document_id": [1, 1],
+                "start_position": [0, 13],
+                "matched_term": ["Soil", "Rivers"],
+                "object_id": ["ENVO:1", "ENVO:2"],
+                "preferred_form": ["soil", "river"],
+            }
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_fn = os.path.join(tmpdir, "out.tsv")
+            sentencify(input_df, output_df, output_fn)
+            result = pd.read_csv(output_fn, sep="\t", header=None)
+        self.assertListEqual(result[5].tolist(), ["Soil is wet.", "Rivers run fast."])
+
+    def test_sentencify_workers(self) -> None:
+        """Testing parallel sentencify writes the same rows in the same order."""
+        input_df = pd.DataFrame(
+            {"id": range(20), "text": [f"Doc {i}. Soil is wet." for i in range(20)]}
+        )
+        output_df = pd.DataFrame(
+            {
+                "document_id": list(range(20)) * 2,
+                "start_position": [0] * 20 + [8] * 20,
+                "matched_term": ["Doc"] * 20 + ["Soil"] * 20,
+                "object_id": ["X:1"] * 20 + ["ENVO:1"] * 20,
+                "preferred_form": ["doc"] * 20 + ["soil"] * 20,
+            }
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            serial_fn = os.path.join(tmpdir, "serial.tsv")
+            parallel_fn = os.path.join(tmpdir, "parallel.tsv")
+            sentencify(input_df, output_df, serial_fn)
+            sentencify(
+                input_df,
+                output_df,
+                parallel_fn,
+                workers=2,
+                shard_size=3,
+                write_batch_size=4,
+            )
+            with open(serial_fn) as sf, open(parallel_fn) as pf:
+                self.assertEqual(sf.read(), pf.read())
@@ -0,0 +1,66 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from ontorunner.post.util import apply_result_dtypes
+from ontorunner.result_io import ResultWriter, iter_results, read_results
+
+
+class TestResultIO(unittest.TestCase):
+    def setUp(self) -> None:
+        self.df = apply_result_dtypes(
+            pd.DataFrame(
+                {
+                    "document_id": [1, 1, 2, 3],
+                    "matched_term": ["soil", "creek", "soil", "acetate"],
+                    "object_id": ["ENVO:1", "ENVO:2", "ENVO:1", "CHEBI:1"],
+                    "origin": ["envo.json", "envo.json", "envo.json", "chebi.json"],
+                    "start": [0, 10, 4, 7],
+                    "ancestors": [["ENVO:0"], [], ["ENVO:0"], ["CHEBI:0"]],
+                }
+            )
+        )
+
+    def write_chunks(self, path: str, output_format: str) -> None:
+        with ResultWriter(path, output_format) as writer:
+            writer.write(self.df.iloc[:0])
+            writer.write(self.df.iloc[:2])
+            writer.write(self.df.iloc[2:])
+
+    def test_tsv(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "results.tsv")
+            self.write_chunks(path, "tsv")
+            results_df = read_results(path)
+            chunks = list(iter_results(path, chunk_size=3))
+        self.assertListEqual(results_df.columns.tolist(), self.df.columns.tolist())
+        self.assertListEqual(results_df["start"].tolist(), [0, 10, 4, 7])
+        self.assertEqual(results_df.loc[0, "ancestors"], "['ENVO:0']")
+        self.assertListEqual([len(c) for c in chunks], [3, 1])
+
+    def test_empty(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "results.tsv")
+            with ResultWriter(path) as writer:
+                writer.write(self.df.iloc[:0])
+            results_df = read_results(path)
+        self.assertTrue(results_df.empty)
+        self.assertListEqual(results_df.columns.tolist(), self.df.columns.tolist())
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "needs pyarrow")
+    def test_columnar(self) -> None:
+        for output_format in ["parquet", "arrow"]:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, "results." + output_format)
+                self.write_chunks(path, output_format)
+                results_df = read_results(path)
+                chunks = list(iter_results(path))
+            self.assertListEqual([len(c) for c in chunks], [2, 2])
+            self.assertEqual(results_df["origin"].dtype, "category")
+            self.assertEqual(results_df["start"].dtype, "int32")
+            self.assertListEqual(
+                results_df["matched_term"].tolist(), self.df["matched_term"].tolist()
+            )
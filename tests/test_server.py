@@ -0,0 +1,86 @@
+import json
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+import pandas as pd
+
+from ontorunner.server import AnnotationServer, BatchingAnnotator
+
+
+class WordBackend(object):
+    """Annotate every word of a document."""
+
+    def annotate(self, input_df: pd.DataFrame):
+        records = [
+            {"document_id": doc_id, "matched_term": word}
+            for doc_id, text in zip(input_df["id"], input_df["text"])
+            for word in text.split()
+        ]
+        return {"annotations": pd.DataFrame(records)}
+
+
+class TestServer(unittest.TestCase):
+    def test_batching_annotator(self) -> None:
+        for workers in [1, 2]:
+            annotator = BatchingAnnotator(WordBackend(), workers=workers, max_wait=0.2)
+            results = {}
+
+            def submit(name, texts):
+                results[name] = annotator.annotate(
+                    pd.DataFrame({"id": ["a", "b"][: len(texts)], "text": texts})
+                )["annotations"]
+
+            threads = [
+                threading.Thread(target=submit, args=("one", ["soil is wet"])),
+                threading.Thread(target=submit, args=("two", ["river", "dry soil"])),
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            annotator.close()
+
+            self.assertListEqual(results["one"]["document_id"].tolist(), ["a"] * 3)
+            self.assertListEqual(
+                results["two"].values.tolist(),
+                [["a", "river"], ["b", "dry"], ["b", "soil"]],
+            )
+
+    def test_batching_annotator_without_annotations(self) -> None:
+        annotator = BatchingAnnotator(WordBackend(), max_wait=0)
+        results = annotator.annotate(pd.DataFrame({"id": ["a"], "text": [""]}))
+        annotator.close()
+        self.assertTrue(results["annotations"].empty)
+
+    def test_annotation_server(self) -> None:
+        annotator = BatchingAnnotator(WordBackend(), max_wait=0)
+        server = AnnotationServer(("127.0.0.1", 0), annotator, quiet=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        url = f"http://127.0.0.1:{server.server_port}/annotate"
+        try:
+            request = urllib.request.Request(
+                url,
+                data=json.dumps(
+                    {"documents": [{"id": 1, "text": "wet soil"}]}
+                ).encode(),
+            )
+            with urllib.request.urlopen(request) as response:
+                body = json.loads(response.read())
+            self.assertListEqual(
+                body["annotations"],
+                [
+                    {"document_id": 1, "matched_term": "wet"},
+                    {"document_id": 1, "matched_term": "soil"},
+                ],
+            )
+
+            with self.assertRaises(urllib.error.HTTPError) as e:
+                urllib.request.urlopen(urllib.request.Request(url, data=b"{}"))
+            self.assertEqual(e.exception.code, 400)
+        finally:
+            server.shutdown()
+            server.server_close()
+            annotator.close()
@@ -1,7 +1,20 @@
 import os
+import tempfile
 import unittest
+from types import SimpleNamespace
+from unittest import mock
 
 import pandas as pd
+import spacy
+from spacy.language import Language
+
+from ontorunner.pipes.onto_matcher import OntoMatcher  # noqa F401
+from ontorunner.pipes.term_index import TermIndex
+from ontorunner.post import util as post_util
+from ontorunner.post.util import AncestorIndex
+from ontorunner.spacy_module import (TOKEN_INFO_COLUMNS, get_token_info,
+                                     iter_input_chunks, iter_processed_chunks)
+from ontorunner.utils import imap_bounded
 
 from . import cleanup, run_spacy
 
@@ -9,6 +22,61 @@ cwd = os.path.abspath(os.path.dirname(__file__))
 data_dir = os.path.join(cwd, "data")
 
 
+@Language.component("no_linker")
+def no_linker(doc):
+    return doc
+
+
+def add_onto_matcher(nlp, terms):
+    """Add an onto_matcher pipe matching `terms` (with ids 'ID:<i>')."""
+    records = [
+        {
+            "matched_term": t,
+            "object_id": f"ID:{i}",
+            "object_category": "biolink:NamedThing",
+            "object_label": t,
+            "object_match_field": "",
+            "origin": "x.json",
+        }
+        for i, t in enumerate(terms)
+    ]
+    onto_matcher = nlp.add_pipe("onto_matcher")
+    onto_matcher.load_term_index(
+        TermIndex.from_records(records, list(nlp.tokenizer.pipe(terms)))
+    )
+
+
+def get_blank_onto_ruler(terms):
+    """Stand-in for an OntoRuler, with a blank pipeline matching `terms`."""
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    # get_knowledge_base_enitities only needs a pipe by that name
+    # when no entity has kb_ents.
+    nlp.add_pipe("no_linker", name="scispacy_linker")
+    spacy.tokens.Span.set_extension("kb_ents", default=[], force=True)
+    add_onto_matcher(nlp, terms)
+    return SimpleNamespace(nlp=nlp)
+
+
+class RecordingPool(object):
+    """Runs tasks when submitted and records how many are in flight."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def apply_async(self, func, args):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        result = func(*args)
+
+        def get():
+            self.in_flight -= 1
+            return result
+
+        return SimpleNamespace(get=get)
+
+
 class TestSpacy(unittest.TestCase):
     def setUp(self) -> None:
         self.output_dir = os.path.join(data_dir, "output")
@@ -36,3 +104,159 @@ class TestSpacy(unittest.TestCase):
         # Clean-up files for next test run
         cleanup(self.output_dir)
         cleanup(self.serialized)
+
+    def test_iter_input_chunks(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_file_list = []
+            for name, ids in [("a", [1, 2, 3]), ("b", [4, 5])]:
+                input_file = os.path.join(tmpdir, name + ".tsv")
+                pd.DataFrame({"id": ids, "text": ["text"] * len(ids)}).to_csv(
+                    input_file, sep="\t", index=False
+                )
+                input_file_list.append(input_file)
+
+            # Chunks hold at most chunk_size documents and never span files.
+            self.assertListEqual(
+                [
+                    chunk["id"].tolist()
+                    for chunk in iter_input_chunks(input_file_list, chunk_size=2)
+                ],
+                [[1, 2], [3], [4, 5]],
+            )
+            self.assertListEqual(
+                [chunk["id"].tolist() for chunk in iter_input_chunks(input_file_list)],
+                [[1, 2, 3, 4, 5]],
+            )
+
+    def test_imap_bounded(self):
+        pool = RecordingPool()
+        consumed = []
+
+        def items():
+            for i in range(10):
+                consumed.append(i)
+                yield i
+
+        results = imap_bounded(pool, lambda i: i * i, items(), window=3)
+        self.assertEqual(next(results), 0)
+        # The input is consumed lazily, a window ahead of the results.
+        self.assertListEqual(consumed, [0, 1, 2])
+        self.assertListEqual(list(results), [i * i for i in range(1, 10)])
+        self.assertEqual(pool.max_in_flight, 3)
+        self.assertEqual(pool.in_flight, 0)
+
+    def test_iter_processed_chunks_workers(self):
+        onto_ruler = get_blank_onto_ruler(["soil", "acetate"])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_file = os.path.join(tmpdir, "input.tsv")
+            pd.DataFrame(
+                {
+                    "id": range(20),
+                    "text": ["Soil bacteria.", "Acetate oxidation."] * 10,
+                }
+            ).to_csv(input_file, sep="\t", index=False)
+
+            def run(workers):
+                return pd.concat(
+                    [
+                        onto_df
+                        for onto_df, _ in iter_processed_chunks(
+                            onto_ruler, {}, [input_file], 3, workers
+                        )
+                    ],
+                    ignore_index=True,
+                )
+
+            serial_df = run(1)
+            self.assertListEqual(serial_df["document_id"].tolist(), list(range(20)))
+            # Chunks processed by several workers are merged in input order.
+            pd.testing.assert_frame_equal(run(3), serial_df)
+
+    def test_get_token_info(self):
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+        add_onto_matcher(nlp, ["soil", "creek sediment", "acetate"])
+        doc = nlp("Soil is wet. Creek sediment oxidizes acetate near Soil.")
+        # ORG, GPE and LOC spans are dropped, as is any other span of
+        # the same text.
+        doc.ents = [
+            spacy.tokens.Span(doc, 0, 1, label="ORG") if e.start == 0 else e
+            for e in doc.ents
+        ]
+        records = get_token_info(doc, document_id=7)
+        self.assertListEqual(
+            [[r[column] for column in TOKEN_INFO_COLUMNS] for r in records],
+            [
+                # The blank pipeline has no POS tags.
+                [7, "Creek sediment", ", ", ", ", "ID:1 [ creek sediment ]"]
+                + ["ID:1", "biolink:NamedThing", "creek sediment", "", "x.json"]
+                + [13, 55, 13, 27],
+                [7, "acetate", "", "", "ID:2 [ acetate ]"]
+                + ["ID:2", "biolink:NamedThing", "acetate", "", "x.json"]
+                + [13, 55, 37, 44],
+            ],
+        )
+
+    def test_run_spacy_chunks(self):
+        onto_ruler = get_blank_onto_ruler(["soil", "acetate", "creek"])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ["input", "output", "stopwords", "nodes_and_edges"]:
+                os.makedirs(os.path.join(tmpdir, name))
+            with open(os.path.join(tmpdir, "stopwords", "stopWords.txt"), "w") as f:
+                f.write("creek")
+            pd.DataFrame(
+                {
+                    "id": range(10),
+                    "text": ["Soil bacteria.", "Acetate oxidation in soil."] * 5,
+                }
+            ).to_csv(os.path.join(tmpdir, "input", "input.tsv"), sep="\t", index=False)
+            pd.DataFrame(
+                {
+                    "subject": ["ID:0", "ID:1"],
+                    "predicate": ["biolink:subclass_of"] * 2,
+                    "object": ["ID:9", "ID:9"],
+                }
+            ).to_csv(
+                os.path.join(tmpdir, "nodes_and_edges", "x_edges.tsv"),
+                sep="\t",
+                index=False,
+            )
+            output_dir = os.path.join(tmpdir, "output")
+            onto_output = os.path.join(output_dir, "ontology_ontoRunNER.tsv")
+
+            def run(chunk_size):
+                with mock.patch(
+                    "ontorunner.pipes.OntoRuler.OntoRuler", return_value=onto_ruler
+                ), mock.patch.object(
+                    AncestorIndex,
+                    "from_edges_file",
+                    wraps=AncestorIndex.from_edges_file,
+                ) as from_edges_file:
+                    run_spacy(
+                        data_dir=tmpdir,
+                        to_pickle=False,
+                        need_ancestors=True,
+                        chunk_size=chunk_size,
+                    )
+                self.assertListEqual(
+                    sorted(os.listdir(output_dir)),
+                    ["ontology_ontoRunNER.tsv", "sciSpacy_umls_ontoRunNER.tsv"],
+                )
+                # The ancestors of an ontology are built once per run.
+                self.assertEqual(from_edges_file.call_count, 1)
+                return pd.read_csv(onto_output, sep="\t")
+
+            single_df = run(None)
+            self.assertEqual(len(single_df), 15)
+            self.assertListEqual(sorted(single_df["ancestors"].unique()), ["['ID:9']"])
+            # Chunks round-trip through an intermediate file.
+            pd.testing.assert_frame_equal(run(3), single_df)
+
+            # The intermediate file is removed when a stage fails.
+            with mock.patch(
+                "ontorunner.pipes.OntoRuler.OntoRuler", return_value=onto_ruler
+            ), mock.patch.object(post_util, "add_doc_ratios", side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    run_spacy(data_dir=tmpdir, to_pickle=False, chunk_size=3)
+            self.assertNotIn(".ontology_ontoRunNER.tmp.tsv", os.listdir(output_dir))
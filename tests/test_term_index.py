@@ -0,0 +1,189 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import spacy
+from spacy.language import Language
+
+from ontorunner.pipes.onto_matcher import OntoMatcher
+from ontorunner.pipes.OntoRuler import OntoRuler
+from ontorunner.pipes.term_index import (TERM_COLUMNS,
+                                         TERM_INDEX_COMBINED_DIR_NAME,
+                                         TERM_INDEX_META_FILENAME,
+                                         MappedStrings, TermIndex,
+                                         load_partitioned_term_index)
+
+
+@Language.component("fail_if_called")
+def fail_if_called(doc):
+    raise AssertionError("Termlists are compiled with the tokenizer only.")
+
+
+class TestTermIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.nlp = spacy.blank("en")
+        self.compiled = []
+
+    def compile_termlist(self, termlist_path: str) -> TermIndex:
+        self.compiled.append(os.path.basename(termlist_path))
+        with open(termlist_path) as f:
+            terms = f.read().split()
+        origin = os.path.basename(termlist_path)
+        records = [
+            dict(zip(TERM_COLUMNS, [t, f"ID:{t}", "", t, "", origin])) for t in terms
+        ]
+        return TermIndex.from_records(records, list(self.nlp.tokenizer.pipe(terms)))
+
+    def test_to_disk(self) -> None:
+        terms = ["creek sediment", "acetate"]
+        records = [
+            dict(zip(TERM_COLUMNS, [t, f"ID:{i}", "cat", t, "", "x.json"]))
+            for i, t in enumerate(terms)
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            TermIndex.from_records(
+                records, list(self.nlp.tokenizer.pipe(terms))
+            ).to_disk(tmpdir, "fingerprint")
+            term_index = TermIndex.from_disk(tmpdir, self.nlp.vocab, "fingerprint")
+            self.assertListEqual(list(term_index.records()), records)
+            self.assertListEqual([d.text for d in term_index.docs], terms)
+
+            # Stale and interrupted indexes are not loaded.
+            self.assertTrue(TermIndex.is_current(tmpdir, "fingerprint"))
+            self.assertFalse(TermIndex.is_current(tmpdir, "other"))
+            self.assertIsNone(TermIndex.from_disk(tmpdir, self.nlp.vocab, "other"))
+            os.remove(os.path.join(tmpdir, TERM_INDEX_META_FILENAME))
+            self.assertFalse(TermIndex.is_current(tmpdir, "fingerprint"))
+            self.assertIsNone(
+                TermIndex.from_disk(tmpdir, self.nlp.vocab, "fingerprint")
+            )
+
+    def test_extract_termlist_info(self) -> None:
+        # The models are not needed to compile a termlist.
+        onto_ruler = OntoRuler.__new__(OntoRuler)
+        onto_ruler.nlp = spacy.blank("en")
+        onto_ruler.nlp.add_pipe("fail_if_called")
+        onto_ruler.tokenizer_batch_size = 2
+        rows = [
+            ["CUI-less", "envo.json", "ENVO:00002007", "creek sediment", "", "cat"],
+            [
+                "CUI-less",
+                "envo.json",
+                "ENVO:00000023",
+                "creek",
+                "[SYNONYM_OF:stream]",
+                "",
+            ],
+            ["CUI-less", "chebi.json", "CHEBI:30089", "acetate", "acetate", "chem"],
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            termlist_path = os.path.join(tmpdir, "termlist.tsv")
+            with open(termlist_path, "w") as f:
+                f.write("\n".join("\t".join(row) for row in rows))
+            term_index = onto_ruler.extract_termlist_info(termlist_path)
+        self.assertListEqual(
+            [d.text for d in term_index.docs], ["creek sediment", "creek", "acetate"]
+        )
+        self.assertListEqual(
+            [
+                (r["object_label"], r["object_match_field"])
+                for r in term_index.records()
+            ],
+            [
+                ("creek sediment", ""),
+                ("stream", "hasRelatedSynonym"),
+                ("acetate", ""),
+            ],
+        )
+
+    def load(self, index_dir, termlist_paths) -> TermIndex:
+        self.compiled = []
+        return load_partitioned_term_index(
+            index_dir, termlist_paths, self.nlp.vocab, "LOWER", self.compile_termlist
+        )
+
+    def test_load_partitioned_term_index(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index_dir = os.path.join(tmpdir, "term_index")
+            paths = [os.path.join(tmpdir, f"{n}_termlist.tsv") for n in ["a", "b"]]
+            for path, terms in zip(paths, ["soil creek", "creek acetate"]):
+                with open(path, "w") as f:
+                    f.write(terms)
+
+            term_index = self.load(index_dir, paths)
+            self.assertListEqual(self.compiled, ["a_termlist.tsv", "b_termlist.tsv"])
+            records = list(term_index.records())
+            self.assertListEqual(
+                [(r["matched_term"], r["origin"]) for r in records],
+                [
+                    ("soil", "a_termlist.tsv"),
+                    ("creek", "a_termlist.tsv"),
+                    ("creek", "b_termlist.tsv"),
+                    ("acetate", "b_termlist.tsv"),
+                ],
+            )
+
+            term_index = self.load(index_dir, paths)
+            self.assertListEqual(self.compiled, [])
+            self.assertListEqual(list(term_index.records()), records)
+            # The combined index is memory-mapped.
+            self.assertIsInstance(term_index.strings, MappedStrings)
+            self.assertIsInstance(term_index.table, np.memmap)
+            # 'creek' is in both termlists.
+            self.assertListEqual(sorted(np.diff(term_index.forms.offsets)), [1, 1, 2])
+            self.assertEqual([d.text for d in term_index.docs][-1], "acetate")
+
+            with open(paths[1], "w") as f:
+                f.write("acetate sediment")
+            term_index = self.load(index_dir, paths)
+            self.assertListEqual(self.compiled, ["b_termlist.tsv"])
+            self.assertEqual(len(term_index), 4)
+
+            self.load(index_dir, paths[1:])
+            self.assertListEqual(self.compiled, [])
+            self.assertListEqual(
+                sorted(os.listdir(index_dir)),
+                ["_combined", "b_termlist", "manifest.json"],
+            )
+
+    def test_shared_term_index(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index_dir = os.path.join(tmpdir, "term_index")
+            paths = [os.path.join(tmpdir, f"{n}_termlist.tsv") for n in ["a", "b"]]
+            for path, terms in zip(paths, ["soil creek", "creek acetate"]):
+                with open(path, "w") as f:
+                    f.write(terms)
+            self.load(index_dir, paths)
+
+            # Two processes loading the index, e.g. spawned workers.
+            onto_matchers = []
+            for _ in range(2):
+                onto_matcher = OntoMatcher(self.nlp.vocab, "onto_matcher", "LOWER", "x")
+                onto_matcher.load_term_index(self.load(index_dir, paths))
+                onto_matchers.append(onto_matcher)
+
+            combined_dir = os.path.realpath(
+                os.path.join(index_dir, TERM_INDEX_COMBINED_DIR_NAME)
+            )
+            mapped_files = []
+            for onto_matcher in onto_matchers:
+                arrays = [
+                    onto_matcher.strings.blob,
+                    onto_matcher.strings.offsets,
+                    onto_matcher.table,
+                    onto_matcher.form_keys,
+                    onto_matcher.form_offsets,
+                    onto_matcher.form_term_ids,
+                ]
+                # The term tables are used without a private copy.
+                self.assertTrue(all(isinstance(a, np.memmap) for a in arrays))
+                mapped_files.append([os.path.realpath(a.filename) for a in arrays])
+            self.assertListEqual(mapped_files[0], mapped_files[1])
+            self.assertTrue(
+                all(os.path.dirname(fn) == combined_dir for fn in mapped_files[0])
+            )
+            # The PhraseMatcher is not shared: each process builds its own.
+            self.assertIsNot(
+                onto_matchers[0].phrase_matcher, onto_matchers[1].phrase_matcher
+            )